@@ -1,17 +1,28 @@
 # -*- coding=utf-8 -*-
+import atexit
+import hashlib
+import http.client
 import io
+import json
+import mmap
 import os
 
 import stat
 import sys
+import threading
+import time
 import typing
 
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import Mapping
 from contextlib import closing, contextmanager
 from pathlib import Path
 from tempfile import NamedTemporaryFile
+from urllib import error as urllib_error
+from urllib import parse as urllib_parse
 from urllib import request
 
-from .path import is_file_url, is_valid_url, path_to_url, url_to_path
+from .path import classify_url, path_to_url, url_to_path
 
 if typing.TYPE_CHECKING:
     from typing import (
@@ -21,8 +32,11 @@ if typing.TYPE_CHECKING:
         ContextManager,
         Dict,
         IO,
+        Iterable,
         Iterator,
+        List,
         Optional,
+        Set,
         Union,
         Text,
         Tuple,
@@ -44,6 +58,7 @@ __all__ = [
     "cd",
     "atomic_open_for_write",
     "open_file",
+    "SessionPool",
     "replaced_stream",
     "replaced_streams",
 ]
@@ -221,11 +236,668 @@ def atomic_open_for_write(target, binary=False, newline=None, encoding=None):
         os.rename(f.name, target)  # No os.replace() on Python 2.
 
 
+class SessionPool(object):
+    """A thread-safe pool of reusable :class:`~requests.Session` instances.
+
+    Sessions are kept per scheme and host so that their connections stay alive
+    between requests. Each session is handed out to one caller at a time, and idle
+    sessions are closed once there are more than *maxsize* of them for a host or they
+    have not been used for *idle_timeout* seconds.
+
+    :param int maxsize: The maximum number of idle sessions kept per host, defaults
+        to 4
+    :param float idle_timeout: The number of seconds after which an idle session is
+        closed, defaults to 60
+    :param session_factory: A callable creating new sessions, defaults to
+        :class:`requests.Session`
+
+    >>> pool = SessionPool(maxsize=8)
+    >>> with pool.session("https://pypi.org/simple/") as session:
+    ...     resp = session.get("https://pypi.org/simple/requests/")
+    >>> with open_file("https://pypi.org/simple/vistir/", session=pool) as fp:
+    ...     contents = fp.read()
+    """
+
+    def __init__(self, maxsize=4, idle_timeout=60.0, session_factory=None):
+        # type: (int, float, Optional[Callable[[], Session]]) -> None
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.session_factory = session_factory
+        self._idle = {}  # type: Dict[Tuple[str, str], List[Tuple[float, Session]]]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        # type: () -> int
+        with self._lock:
+            return sum(len(sessions) for sessions in self._idle.values())
+
+    @staticmethod
+    def _get_key(url):
+        # type: (str) -> Tuple[str, str]
+        parsed = urllib_parse.urlsplit(url)
+        return (parsed.scheme.lower(), parsed.netloc.lower())
+
+    def _evict_expired(self, now):
+        # type: (float) -> List[Session]
+        expired = []
+        for key in list(self._idle):
+            sessions = self._idle[key]
+            while sessions and now - sessions[0][0] > self.idle_timeout:
+                expired.append(sessions.pop(0)[1])
+            if not sessions:
+                del self._idle[key]
+        return expired
+
+    def acquire(self, url):
+        # type: (str) -> Session
+        """Take an idle session for the host of *url*, or create a new one.
+
+        :param str url: The url which will be requested
+        :return: A session which must be handed back with :meth:`release`
+        """
+
+        key = self._get_key(url)
+        with self._lock:
+            expired = self._evict_expired(time.monotonic())
+            sessions = self._idle.get(key)
+            session = sessions.pop()[1] if sessions else None
+        for stale in expired:
+            stale.close()
+        if session is None:
+            if self.session_factory is not None:
+                session = self.session_factory()
+            else:
+                import requests
+
+                session = requests.Session()
+        return session
+
+    def release(self, url, session):
+        # type: (str, Session) -> None
+        """Return a session taken with :meth:`acquire` to the pool.
+
+        :param str url: The url passed to :meth:`acquire`
+        :param session: The session to return
+        """
+
+        key = self._get_key(url)
+        now = time.monotonic()
+        with self._lock:
+            expired = self._evict_expired(now)
+            sessions = self._idle.setdefault(key, [])
+            if len(sessions) < self.maxsize:
+                sessions.append((now, session))
+            else:
+                expired.append(session)
+        for stale in expired:
+            stale.close()
+
+    @contextmanager
+    def session(self, url):
+        # type: (str) -> Iterator[Session]
+        """Borrow a session for the host of *url* for the duration of the context.
+
+        :param str url: The url which will be requested
+        """
+
+        session = self.acquire(url)
+        try:
+            yield session
+        finally:
+            self.release(url, session)
+
+    def clear(self):
+        # type: () -> None
+        """Close every idle session."""
+
+        with self._lock:
+            sessions = [session for idle in self._idle.values() for _, session in idle]
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+
+_default_session_pool = SessionPool()
+atexit.register(_default_session_pool.clear)
+
+
+@contextmanager
+def _borrow_session(link, session):
+    # type: (str, Optional[Union[Session, SessionPool]]) -> Iterator[Optional[Session]]
+    """Yield the session to request *link* with, borrowing one from a pool unless a
+    session was given, or None if :mod:`requests` is unavailable."""
+    pool = None
+    if isinstance(session, SessionPool):
+        pool = session
+    elif not session:
+        try:
+            import requests  # noqa
+        except ImportError:
+            session = None
+        else:
+            pool = _default_session_pool
+    if pool is not None:
+        session = pool.acquire(link)
+    try:
+        yield session
+    finally:
+        if pool is not None:
+            pool.release(link, session)
+
+
+_DEFAULT_CACHE_SIZE = 1 << 30
+_CACHE_CHUNK_SIZE = 1 << 16
+
+
+@contextmanager
+def _http_get(
+    link,  # type: str
+    session,  # type: Optional[Session]
+    headers,  # type: Dict[str, str]
+):
+    # type: (...) -> Iterator[Tuple[int, Any, Optional[Iterator[bytes]]]]
+    """Request *link* with *headers*, yielding the status, the response headers and an
+    iterator over the body, which is None for ``304 Not Modified`` responses.
+
+    :raises: The HTTP error of either library for other unsuccessful responses.
+    """
+    if session is None:
+        try:
+            response = request.urlopen(request.Request(link, headers=headers))
+        except urllib_error.HTTPError as exc:
+            if exc.code != 304:
+                raise
+            exc.close()
+            yield exc.code, exc.headers, None
+        else:
+            with closing(response):
+                chunks = iter(lambda: response.read(_CACHE_CHUNK_SIZE), b"")
+                yield response.status, response.headers, chunks
+    else:
+        with session.get(link, headers=headers, stream=True) as resp:
+            if resp.status_code == 304:
+                yield resp.status_code, resp.headers, None
+            else:
+                resp.raise_for_status()
+                chunks = resp.iter_content(chunk_size=_CACHE_CHUNK_SIZE)
+                yield resp.status_code, resp.headers, chunks
+
+
+def _get_cached_content_path(cache_dir, digest):
+    # type: (str, str) -> str
+    return os.path.join(cache_dir, "content", digest[:2], digest)
+
+
+def _read_cache_metadata(metadata_path):
+    # type: (str) -> Optional[Dict[str, Any]]
+    try:
+        with io.open(metadata_path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _replace_from_temporary_file(target, write):
+    # type: (str, Callable[[IO[bytes]], _T]) -> _T
+    """Write a file next to *target* with *write* and then move it into place, so that
+    other processes only ever see complete files."""
+    target_dir = os.path.dirname(target)
+    os.makedirs(target_dir, exist_ok=True)
+    with NamedTemporaryFile(dir=target_dir, prefix=".tmp-", delete=False) as fh:
+        try:
+            result = write(fh)
+        except BaseException:
+            fh.close()
+            os.remove(fh.name)
+            raise
+    os.replace(fh.name, target)
+    return result
+
+
+def _store_cache_content(cache_dir, chunks):
+    # type: (str, Iterator[bytes]) -> str
+    """Save a downloaded body under its sha256 digest, returning its path."""
+    tmp_dir = os.path.join(cache_dir, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    hasher = hashlib.sha256()
+    with NamedTemporaryFile(dir=tmp_dir, delete=False) as fh:
+        try:
+            for chunk in chunks:
+                hasher.update(chunk)
+                fh.write(chunk)
+        except BaseException:
+            fh.close()
+            os.remove(fh.name)
+            raise
+    content_path = _get_cached_content_path(cache_dir, hasher.hexdigest())
+    if os.path.exists(content_path):
+        os.remove(fh.name)
+        _touch_cached_content(content_path)
+    else:
+        os.makedirs(os.path.dirname(content_path), exist_ok=True)
+        os.replace(fh.name, content_path)
+    return content_path
+
+
+def _touch_cached_content(content_path):
+    # type: (str) -> None
+    try:
+        os.utime(content_path, None)
+    except OSError:
+        pass
+
+
+def _evict_cache(cache_dir, max_size, keep):
+    # type: (str, int, str) -> None
+    """Remove the least recently used bodies until the cache fits in *max_size*
+    bytes, sparing the one at *keep*."""
+    entries = []
+    total = 0
+    content_dir = os.path.join(cache_dir, "content")
+    with os.scandir(content_dir) as subdirs:
+        for subdir in subdirs:
+            if not subdir.is_dir():
+                continue
+            with os.scandir(subdir.path) as files:
+                for entry in files:
+                    try:
+                        entry_stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+                    total += entry_stat.st_size
+    if total <= max_size:
+        return
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process removed it first, or it is open on Windows
+            continue
+        total -= size
+
+
+# The number of times a cached body is downloaded again when it is evicted by another
+# process before it can be opened
+_CACHE_OPEN_ATTEMPTS = 3
+
+
+def _open_cached_content(content_path):
+    # type: (str) -> Optional[IO[bytes]]
+    try:
+        return io.open(content_path, "rb")
+    except FileNotFoundError:
+        return None
+
+
+def _download_ranges_into_cache(link, session, cache_dir, parallel):
+    # type: (str, Optional[Session], str, int) -> Optional[Tuple[str, Any]]
+    """Download *link* with :func:`_download_in_ranges` and store it in *cache_dir*,
+    returning its path there and the response headers, or None if the server does not
+    support range requests."""
+    download = _download_in_ranges(link, session, parallel)
+    if download is None:
+        return None
+    download_path, response_headers = download
+    try:
+        with io.open(download_path, "rb") as fh:
+            chunks = iter(lambda: fh.read(_CACHE_CHUNK_SIZE), b"")
+            content_path = _store_cache_content(cache_dir, chunks)
+    finally:
+        os.remove(download_path)
+    return content_path, response_headers
+
+
+def _fetch_into_cache(link, session, cache_dir, max_size, parallel=None):
+    # type: (str, Optional[Session], str, Optional[int], Optional[int]) -> IO[bytes]
+    """Open an up to date copy of *link* in *cache_dir*, downloading it or
+    revalidating an existing copy with the server as needed. With *parallel*, copies
+    which have to be downloaded from scratch are fetched with range requests.
+
+    The copy is opened here so that it stays readable if another process evicts it
+    afterwards. One which is evicted before it can be opened is downloaded again."""
+    url_digest = hashlib.sha256(link.encode("utf-8")).hexdigest()
+    metadata_path = os.path.join(cache_dir, "urls", url_digest[:2], url_digest + ".json")
+    for _ in range(_CACHE_OPEN_ATTEMPTS):
+        metadata = _read_cache_metadata(metadata_path)
+        headers = {"Accept-Encoding": "identity"}
+        cached_path = None
+        if metadata and metadata.get("url") == link:
+            cached_path = _get_cached_content_path(cache_dir, metadata["sha256"])
+            if os.path.exists(cached_path):
+                if metadata.get("etag"):
+                    headers["If-None-Match"] = metadata["etag"]
+                if metadata.get("last_modified"):
+                    headers["If-Modified-Since"] = metadata["last_modified"]
+            else:
+                cached_path = None
+        download = None
+        if cached_path is None and parallel is not None and parallel > 1:
+            download = _download_ranges_into_cache(link, session, cache_dir, parallel)
+        if download is not None:
+            content_path, response_headers = download
+        else:
+            with _http_get(link, session, headers) as (status, response_headers, chunks):
+                if chunks is None:
+                    if cached_path is None:
+                        raise ValueError(
+                            "Unexpected response {} for {}".format(status, link)
+                        )
+                    cached_file = _open_cached_content(cached_path)
+                    if cached_file is None:
+                        continue
+                    _touch_cached_content(cached_path)
+                    return cached_file
+                content_path = _store_cache_content(cache_dir, chunks)
+        metadata = {
+            "url": link,
+            "sha256": os.path.basename(content_path),
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+        }
+        payload = json.dumps(metadata).encode("utf-8")
+        _replace_from_temporary_file(
+            metadata_path, lambda fh, payload=payload: fh.write(payload)
+        )
+        cached_file = _open_cached_content(content_path)
+        if cached_file is None:
+            continue
+        if max_size is not None:
+            _evict_cache(cache_dir, max_size, keep=content_path)
+        return cached_file
+    raise IOError(
+        "{} was repeatedly evicted from {} before it could be opened".format(
+            link, cache_dir
+        )
+    )
+
+
+# Ranges are never smaller than this, so only large files are downloaded in parallel
+_MIN_RANGE_SIZE = 1 << 20
+_RANGE_RETRIES = 3
+# The pause before the first retry of a range, which doubles on each further retry
+_RANGE_RETRY_DELAY = 0.1
+
+
+class _RangesNotSupported(Exception):
+    pass
+
+
+def _parse_content_range(value):
+    # type: (Optional[str]) -> Optional[Tuple[int, int, Optional[int]]]
+    """Parse a ``Content-Range`` header of the form ``bytes 0-99/1000`` into its first
+    and last positions and the complete length, which is None if it is unknown."""
+    unit, _, content_range = (value or "").partition(" ")
+    byte_range, _, length = content_range.partition("/")
+    first, _, last = byte_range.partition("-")
+    if unit.lower() != "bytes":
+        return None
+    try:
+        return int(first), int(last), None if length == "*" else int(length)
+    except ValueError:
+        return None
+
+
+def _probe_ranges(link, session):
+    # type: (str, Optional[Session]) -> Optional[Tuple[str, int, Any]]
+    """Find the final url, the length and the response headers of *link* if its server
+    accepts byte ranges.
+
+    The probe asks for the first byte of the body rather than sending a ``HEAD``
+    request, which servers such as S3 reject for urls signed for ``GET`` only. Any
+    failure is treated as a lack of support so that the caller falls back to a plain
+    download, which reports the error if it persists.
+    """
+    headers = {"Accept-Encoding": "identity", "Range": "bytes=0-0"}
+    try:
+        if session is None:
+            with closing(request.urlopen(request.Request(link, headers=headers))) as resp:
+                url, status, response_headers = resp.geturl(), resp.status, resp.headers
+        else:
+            with session.get(link, headers=headers, stream=True) as resp:
+                resp.raise_for_status()
+                url, status, response_headers = resp.url, resp.status_code, resp.headers
+    except (OSError, http.client.HTTPException):
+        return None
+    if status != 206:
+        return None
+    content_range = _parse_content_range(response_headers.get("Content-Range"))
+    if content_range is None or content_range[2] is None:
+        return None
+    return url, content_range[2], response_headers
+
+
+def _clone_session(session):
+    # type: (Session) -> Session
+    """Copy *session* for use from another thread.
+
+    Headers, cookies and the other per-request settings are copied while the
+    transport adapters, whose connection pools are thread-safe, stay shared. The copy
+    must not be closed, as that would close the adapters of *session* too.
+    """
+    clone = object.__new__(type(session))
+    clone.__dict__.update(session.__dict__)
+    clone.headers = session.headers.copy()
+    clone.cookies = session.cookies.copy()
+    clone.auth = session.auth
+    clone.proxies = dict(session.proxies)
+    clone.params = dict(session.params)
+    clone.hooks = {event: list(hooks) for event, hooks in session.hooks.items()}
+    clone.adapters = session.adapters.copy()
+    return clone
+
+
+def _fetch_range(url, session, path, start, end, stop):
+    # type: (str, Any, str, int, int, threading.Event) -> None
+    """Download bytes *start* to *end* of *url* into the same positions of the file at
+    *path*, resuming from the last byte written if the connection drops."""
+    offset = start
+    failures = 0
+    with _borrow_session(url, session) as fetch_session, io.open(path, "r+b") as fh:
+        while offset <= end and not stop.is_set():
+            headers = {
+                "Accept-Encoding": "identity",
+                "Range": "bytes={}-{}".format(offset, end),
+            }
+            try:
+                with _http_get(url, fetch_session, headers) as (
+                    status,
+                    response_headers,
+                    chunks,
+                ):
+                    content_range = _parse_content_range(
+                        response_headers.get("Content-Range")
+                    )
+                    # Anything but the requested range would end up in the wrong place
+                    if status != 206 or content_range is None or content_range[0] != offset:
+                        raise _RangesNotSupported(url)
+                    fh.seek(offset)
+                    for chunk in chunks:
+                        chunk = chunk[: end + 1 - offset]
+                        fh.write(chunk)
+                        offset += len(chunk)
+                        if offset > end or stop.is_set():
+                            break
+            except (OSError, http.client.HTTPException):
+                failures += 1
+                if failures > _RANGE_RETRIES:
+                    raise
+                stop.wait(_RANGE_RETRY_DELAY * 2 ** (failures - 1))
+                continue
+            if offset <= end and not stop.is_set():
+                failures += 1
+                if failures > _RANGE_RETRIES:
+                    raise IOError(
+                        "Incomplete download of bytes {}-{} from {}".format(start, end, url)
+                    )
+                stop.wait(_RANGE_RETRY_DELAY * 2 ** (failures - 1))
+
+
+def _download_in_ranges(link, session, parallel):
+    # type: (str, Any, int) -> Optional[Tuple[str, Any]]
+    """Download *link* into a temporary file using up to *parallel* concurrent range
+    requests, returning its path and the headers the server first responded with, or
+    None if the server does not support them."""
+    with _borrow_session(link, session) as probe_session:
+        probe = _probe_ranges(link, probe_session)
+    if probe is None:
+        return None
+    url, size, response_headers = probe
+    part_size = max(-(-size // parallel), _MIN_RANGE_SIZE)
+    if part_size >= size:
+        return None
+    ranges = [
+        (start, min(start + part_size, size) - 1) for start in range(0, size, part_size)
+    ]
+    with NamedTemporaryFile(prefix="vistir-", suffix="-download", delete=False) as fh:
+        fh.truncate(size)
+    stop = threading.Event()
+    try:
+        with ThreadPoolExecutor(max_workers=min(parallel, len(ranges))) as executor:
+            futures = [
+                executor.submit(
+                    _fetch_range,
+                    url,
+                    # A session of the caller's can't be shared between the workers
+                    session
+                    if not session or isinstance(session, SessionPool)
+                    else _clone_session(session),
+                    fh.name,
+                    start,
+                    end,
+                    stop,
+                )
+                for start, end in ranges
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                stop.set()
+    except _RangesNotSupported:
+        os.remove(fh.name)
+        return None
+    except BaseException:
+        os.remove(fh.name)
+        raise
+    return fh.name, response_headers
+
+
+class _HashingReader(object):
+    """A read-only wrapper around a file-like object which feeds everything read from
+    it to a set of :mod:`hashlib` digests."""
+
+    def __init__(self, fp, hashes, name=None):
+        # type: (IO[bytes], Union[Iterable[str], Mapping[str, Any]], Optional[str]) -> None
+        self._fp = fp
+        self.name = name
+        self.expected = {}  # type: Dict[str, Set[str]]
+        if isinstance(hashes, str):
+            hashes = [hashes]
+        elif isinstance(hashes, Mapping):
+            for algorithm, digests in hashes.items():
+                if isinstance(digests, str):
+                    digests = [digests]
+                self.expected[algorithm] = {digest.lower() for digest in digests}
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in hashes}
+        self._updaters = [hasher.update for hasher in self.hashes.values()]
+
+    def __getattr__(self, name):
+        # type: (str) -> Any
+        return getattr(self._fp, name)
+
+    def __iter__(self):
+        # type: () -> Iterator[bytes]
+        return iter(self.readline, b"")
+
+    def __enter__(self):
+        # type: () -> _HashingReader
+        return self
+
+    def __exit__(self, *args):
+        # type: (Any) -> None
+        self.close()
+
+    def _update(self, data):
+        # type: (bytes) -> bytes
+        for update in self._updaters:
+            update(data)
+        return data
+
+    def read(self, size=-1):
+        # type: (int) -> bytes
+        return self._update(self._fp.read(size) if size != -1 else self._fp.read())
+
+    def read1(self, size=-1):
+        # type: (int) -> bytes
+        read1 = getattr(self._fp, "read1", self._fp.read)
+        return self._update(read1(size) if size != -1 else read1())
+
+    def readinto(self, buffer):
+        # type: (Any) -> int
+        count = self._fp.readinto(buffer)
+        if count:
+            with memoryview(buffer) as view:
+                self._update(view[:count])
+        return count
+
+    def readline(self, size=-1):
+        # type: (int) -> bytes
+        return self._update(self._fp.readline(size))
+
+    def readlines(self, hint=-1):
+        # type: (int) -> List[bytes]
+        return [self._update(line) for line in self._fp.readlines(hint)]
+
+    def readable(self):
+        # type: () -> bool
+        return True
+
+    def seekable(self):
+        # type: () -> bool
+        return False
+
+    def hexdigests(self):
+        # type: () -> Dict[str, str]
+        """Return the hex digests of everything read so far, by algorithm name."""
+        return {algorithm: hasher.hexdigest() for algorithm, hasher in self.hashes.items()}
+
+    def verify(self):
+        # type: () -> None
+        """Read the rest of the file and compare its digests to the expected ones.
+
+        :raises ValueError: If any of the digests does not match.
+        """
+        if not self.expected:
+            return
+        while self.read(1 << 16):
+            pass
+        for algorithm, digest in self.hexdigests().items():
+            if digest not in self.expected[algorithm]:
+                raise ValueError(
+                    "{} hash mismatch for {}: expected {}, got {}".format(
+                        algorithm,
+                        self.name,
+                        " or ".join(sorted(self.expected[algorithm])),
+                        digest,
+                    )
+                )
+
+
 @contextmanager
 def open_file(
     link,  # type: Union[_T, str]
     session=None,  # type: Optional[Session]
     stream=True,  # type: bool
+    cache_dir=None,  # type: Optional[str]
+    cache_size=_DEFAULT_CACHE_SIZE,  # type: Optional[int]
+    parallel=None,  # type: Optional[int]
+    hashes=None,  # type: Optional[Union[Iterable[str], Mapping[str, Any]]]
+    mmap=False,  # type: bool
 ):
     # type: (...) -> ContextManager[Union[IO[bytes], Urllib3_HTTPResponse, Urllib_HTTPResponse]]
     """
@@ -233,9 +905,34 @@ def open_file(
 
     :param pip._internal.index.Link link: A link object from resolving dependencies with
         pip, or else a URL.
-    :param Optional[Session] session: A :class:`~requests.Session` instance
+    :param Optional[Session] session: A :class:`~requests.Session` instance, or a
+        :class:`SessionPool` to borrow one from. Defaults to a shared pool of sessions
+        which keeps connections alive across calls.
     :param bool stream: Whether to stream the content if remote, default True
-    :raises ValueError: If link points to a local directory.
+    :param str cache_dir: A directory in which to cache remote files, optional. Cached
+        copies are revalidated with the server using their `ETag` and `Last-Modified`
+        headers and are then read from local disk. The directory can be shared by
+        several processes.
+    :param int cache_size: The size in bytes above which the least recently used files
+        are removed from `cache_dir`, or None for no limit, defaults to 1 GiB
+    :param int parallel: The number of concurrent HTTP range requests to download large
+        remote files with, optional. The file is assembled in a temporary file, which
+        is what is returned, or with `cache_dir` is stored in the cache when it holds no
+        copy of it yet. Servers which do not answer range requests are read from a
+        single stream as usual. Each request is made from its own thread, with a
+        copy of `session` sharing its connection pools if a session was given.
+    :param hashes: Names of :mod:`hashlib` algorithms, optional. When given, the
+        file is wrapped in a reader which computes these digests while it is read,
+        available from its ``hexdigests()`` method. If `hashes` is a mapping of
+        algorithm names to an expected hex digest, or to a list of acceptable ones, the
+        rest of the file is read and the digests are verified when the context exits.
+    :param bool mmap: Whether to return a read-only :class:`mmap.mmap` of the file
+        instead of a file object, which can be sliced or passed to anything accepting
+        a buffer without copying. Empty files give ``b""``. Remote files must be
+        downloaded to local disk first using `cache_dir` or `parallel`. Defaults to
+        False.
+    :raises ValueError: If link points to a local directory, if the file does not
+        match the expected `hashes`, or if a remote file cannot be memory-mapped.
     :return: a context manager to the opened file-like object
     """
     if not isinstance(link, str):
@@ -243,43 +940,113 @@ def open_file(
             link = link.url_without_fragment
         except AttributeError:
             raise ValueError("Cannot parse url from unknown type: {0!r}".format(link))
+    if mmap and hashes is not None:
+        raise ValueError("Cannot compute hashes while reading a memory-mapped file")
+
+    with _open_link(
+        link, session, stream, cache_dir, cache_size, parallel, use_mmap=mmap
+    ) as fp:
+        if hashes is None:
+            yield fp
+        else:
+            reader = _HashingReader(fp, hashes, name=link)
+            yield reader
+            reader.verify()
+
+
+@contextmanager
+def _open_local_file(local_path, use_mmap=False):
+    # type: (str, bool) -> Iterator[Union[IO[bytes], mmap.mmap, bytes]]
+    with io.open(local_path, "rb") as local_file:
+        with _map_local_file(local_file, use_mmap) as result:
+            yield result
+
 
-    if not is_valid_url(link) and os.path.exists(link):
+@contextmanager
+def _map_local_file(local_file, use_mmap=False):
+    # type: (IO[bytes], bool) -> Iterator[Union[IO[bytes], mmap.mmap, bytes]]
+    """Yield the open *local_file* as it is, or memory-mapped if *use_mmap* is set."""
+    if not use_mmap:
+        yield local_file
+        return
+    try:
+        mapped = mmap.mmap(local_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Empty files cannot be mapped
+        if os.fstat(local_file.fileno()).st_size:
+            raise
+        yield b""
+        return
+    try:
+        yield mapped
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            # Views of the map are still in use; it is closed once they are gone
+            pass
+
+
+@contextmanager
+def _open_link(link, session, stream, cache_dir, cache_size, parallel, use_mmap=False):
+    # type: (str, Any, bool, Optional[str], Optional[int], Optional[int], bool) -> Iterator[Any]
+    url_info = classify_url(link)
+    if not url_info.is_valid and os.path.exists(link):
         link = path_to_url(link)
+        is_file = True
+    else:
+        is_file = url_info.is_file
 
-    if is_file_url(link):
+    if not is_file and cache_dir is not None:
+        with _borrow_session(link, session) as fetch_session:
+            cached_file = _fetch_into_cache(
+                link, fetch_session, os.fspath(cache_dir), cache_size, parallel
+            )
+        with cached_file, _map_local_file(cached_file, use_mmap) as result:
+            yield result
+        return
+
+    if not is_file and parallel is not None and parallel > 1:
+        download = _download_in_ranges(link, session, parallel)
+        if download is not None:
+            download_path = download[0]
+            try:
+                with _open_local_file(download_path, use_mmap) as downloaded_file:
+                    yield downloaded_file
+            finally:
+                os.remove(download_path)
+            return
+
+    if is_file:
         # Local URL
         local_path = url_to_path(link)
         if os.path.isdir(local_path):
             raise ValueError("Cannot open directory for read: {}".format(link))
         else:
-            with io.open(local_path, "rb") as local_file:
+            with _open_local_file(local_path, use_mmap) as local_file:
                 yield local_file
     else:
         # Remote URL
+        if use_mmap:
+            raise ValueError(
+                "Cannot memory-map remote file {}, use cache_dir to read it from "
+                "local disk".format(link)
+            )
         headers = {"Accept-Encoding": "identity"}
-        if not session:
-            try:
-                from requests import Session  # noqa
-            except ImportError:
-                session = None
+        with _borrow_session(link, session) as session:
+            if session is None:
+                with closing(request.urlopen(link)) as f:
+                    yield f
             else:
-                session = Session()
-        if session is None:
-            with closing(request.urlopen(link)) as f:
-                yield f
-        else:
-            with session.get(link, headers=headers, stream=stream) as resp:
-                try:
+                with session.get(link, headers=headers, stream=stream) as resp:
                     raw = getattr(resp, "raw", None)
                     result = raw if raw else resp
-                    yield result
-                finally:
-                    if raw:
-                        conn = raw._connection
-                        if conn is not None:
-                            conn.close()
-                    result.close()
+                    try:
+                        yield result
+                    finally:
+                        # Fully read responses have already handed their connection
+                        # back to the session; anything else is discarded here
+                        result.close()
 
 
 @contextmanager
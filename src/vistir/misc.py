@@ -1,18 +1,37 @@
+import asyncio
+import codecs
+import functools
 import io
 import json
 import locale
 import logging
 import os
+import selectors
+import signal
 import subprocess
 import sys
 import threading
+import time
 import warnings
 
+from collections import deque
 from itertools import tee
 from weakref import WeakKeyDictionary
 
 from queue import Empty, Queue
-from typing import Iterable, List, Optional, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from .cmdparse import Script
 
@@ -23,10 +42,14 @@ __all__ = [
     "shell_escape",
     "unnest",
     "run",
+    "run_async",
+    "run_many",
     "load_path",
     "partialclass",
     "to_text",
     "to_bytes",
+    "to_text_many",
+    "to_bytes_many",
     "locale_encoding",
     "getpreferredencoding",
     "decode_for_output",
@@ -109,6 +132,18 @@ def _is_iterable(elem):
     return False
 
 
+def _resolve_command(script):
+    # type: (Script) -> Tuple[Union[str, List[str]], bool]
+    """Resolve a :class:`~vistir.cmdparse.Script` to a ``(cmd, shell)`` pair."""
+    from shutil import which
+
+    command = which(script.command)
+    # Command not found, maybe this is a shell built-in?
+    if not command:
+        return script.cmdify(), True
+    return [command] + script.args, False
+
+
 def _spawn_subprocess(
     script,  # type: Union[str, List[str]]
     env=None,  # type: Optional[Dict[str, str]]
@@ -116,16 +151,14 @@ def _spawn_subprocess(
     cwd=None,  # type: Optional[Union[str, Path]]
     combine_stderr=True,  # type: bool
     encoding="utf-8",  # type: str
+    new_session=False,  # type: bool
 ):
-    from shutil import which
-
     if os.name != "nt":
         class WindowsError(OSError):
             """this exception is only available on windows"""
 
     if not env:
         env = os.environ.copy()
-    command = which(script.command)
     options = {
         "env": env,
         "universal_newlines": True,
@@ -141,11 +174,10 @@ def _spawn_subprocess(
         options["stdin"] = subprocess.PIPE
     if cwd:
         options["cwd"] = cwd
-    # Command not found, maybe this is a shell built-in?
-    cmd = [command] + script.args
-    if not command:  # Try to use CreateProcess directly if possible.
-        cmd = script.cmdify()
-        options["shell"] = True
+    if new_session and os.name != "nt":
+        # Lead a new process group so a timeout or a closed stream can signal the tree
+        options["start_new_session"] = True
+    cmd, options["shell"] = _resolve_command(script)
 
     # Try to use CreateProcess directly if possible. Specifically catch
     # Windows error 193 "Command is not a valid Win32 application" to handle
@@ -160,7 +192,129 @@ def _spawn_subprocess(
     return subprocess.Popen(script.cmdify(), **options)
 
 
+async def _spawn_subprocess_async(
+    script,  # type: Script
+    env=None,  # type: Optional[Dict[str, str]]
+    cwd=None,  # type: Optional[Union[str, Path]]
+    combine_stderr=False,  # type: bool
+    new_session=False,  # type: bool
+):
+    # type: (...) -> asyncio.subprocess.Process
+    if not env:
+        env = os.environ.copy()
+    options = {
+        "env": env,
+        "stdout": asyncio.subprocess.PIPE,
+        "stderr": asyncio.subprocess.PIPE
+        if not combine_stderr
+        else asyncio.subprocess.STDOUT,
+    }
+    if cwd:
+        options["cwd"] = cwd
+    if new_session and os.name != "nt":
+        options["start_new_session"] = True
+    cmd, shell = _resolve_command(script)
+    if not shell:
+        # Same Windows error 193 fallback as :func:`_spawn_subprocess`
+        try:
+            return await asyncio.create_subprocess_exec(*cmd, **options)
+        except OSError as err:  # pragma: no cover
+            if getattr(err, "winerror", 9999) != 193:
+                raise
+    return await asyncio.create_subprocess_shell(script.cmdify(), **options)
+
+
+def _signal_subprocess(c, force=False):
+    # type: (Union[subprocess.Popen, asyncio.subprocess.Process], bool) -> None
+    """Send SIGTERM (or SIGKILL if *force*) to the process group led by *c*.
+
+    Only valid for processes spawned with ``new_session=True``; on Windows only *c*
+    itself is terminated.
+    """
+    if os.name == "nt":
+        try:
+            if force:
+                c.kill()
+            else:
+                c.terminate()
+        except OSError:  # pragma: no cover
+            pass
+        return
+    try:
+        os.killpg(c.pid, signal.SIGKILL if force else signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        # The whole group is already gone
+        pass
+
+
+def _terminate_subprocess(c, kill_after=5):
+    # type: (subprocess.Popen, Optional[float]) -> None
+    """Terminate the process group of *c*, killing it if still around after
+    *kill_after* seconds."""
+    _signal_subprocess(c)
+    try:
+        c.wait(timeout=kill_after)
+    except subprocess.TimeoutExpired:
+        pass
+    # Also reap anything the leader left behind in its group
+    _signal_subprocess(c, force=True)
+    c.wait()
+
+
+def _decode_subprocess_output(output, encoding):
+    # type: (Optional[bytes], str) -> str
+    if not output:
+        return ""
+    text = to_text(output, encoding=encoding, errors="backslashreplace")
+    # Match the universal newlines translation of the text mode pipes used by `run`
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class _TailBuffer(deque):
+    """A deque of lines bounded by a number of lines and/or by their total size."""
+
+    def __init__(self, maxlen=None, maxsize=None, sizeof=len):
+        # type: (Optional[int], Optional[int], Callable[[Any], int]) -> None
+        super(_TailBuffer, self).__init__(maxlen=maxlen)
+        self.maxsize = maxsize
+        self.size = 0
+        self._sizeof = sizeof
+
+    def append(self, item):
+        # type: (Any) -> None
+        if self.maxlen == 0:
+            return
+        if self.maxlen is not None and len(self) == self.maxlen:
+            self.size -= self._sizeof(self[0])
+        super(_TailBuffer, self).append(item)
+        self.size += self._sizeof(item)
+        # Always keep the newest line, even if it is larger than maxsize by itself
+        while self.maxsize is not None and self.size > self.maxsize and len(self) > 1:
+            self.size -= self._sizeof(self.popleft())
+
+
+def _line_size(line):
+    # type: (str) -> int
+    return len(line) + 1
+
+
+def _tail_item_size(item):
+    # type: (Tuple[str, str]) -> int
+    return len(item[1]) + 1
+
+
 class SubprocessStreamWrapper(object):
+    #: The number of bytes to request from a pipe per read
+    read_size = 65536
+    #: The number of decoded lines which may wait for a consumer when streaming or
+    #: when capture is bounded by ``tail_lines``, ``tail_chars`` or ``spill_to_disk``
+    max_queued_lines = 1000
+    #: The number of lines kept in memory when spilling to disk without a tail limit
+    spill_tail_lines = 1000
+    #: The number of seconds to wait for the pipes to reach EOF once a stream which is
+    #: closed early has killed its subprocess
+    close_timeout = 1.0
+
     def __init__(
         self,
         display_stderr_maxlen=200,  # type: int
@@ -169,6 +323,12 @@ class SubprocessStreamWrapper(object):
         spinner=None,  # type: Optional[VistirSpinner]
         verbose=False,  # type: bool
         stdout_allowed=False,  # type: bool
+        streaming=False,  # type: bool
+        tail_lines=None,  # type: Optional[int]
+        tail_chars=None,  # type: Optional[int]
+        spill_to_disk=False,  # type: bool
+        timeout=None,  # type: Optional[float]
+        kill_after=5,  # type: Optional[float]
     ):
         # type: (...) -> None
         stdout_encoding = None
@@ -180,9 +340,18 @@ class SubprocessStreamWrapper(object):
         self.stdout_encoding = stdout_encoding or preferred_encoding
         self.stderr_encoding = stderr_encoding or preferred_encoding
         self.stdout_lines = []
-        self.text_stdout_lines = []
         self.stderr_lines = []
-        self.text_stderr_lines = []
+        bounded = tail_lines is not None or tail_chars is not None
+        if spill_to_disk and not bounded:
+            # The complete output is on disk, only keep its end in memory
+            tail_lines = self.spill_tail_lines
+            bounded = True
+        if bounded:
+            self.text_stdout_lines = _TailBuffer(tail_lines, tail_chars, _line_size)
+            self.text_stderr_lines = _TailBuffer(tail_lines, tail_chars, _line_size)
+        else:
+            self.text_stdout_lines = []
+            self.text_stderr_lines = []
         self.display_line = ""
         self.display_line_loops_displayed = 0
         self.display_line_shown_for_loops = display_line_for_loops
@@ -192,32 +361,144 @@ class SubprocessStreamWrapper(object):
         self.verbose = verbose
         self._iterated_stdout = None
         self._iterated_stderr = None
-        self._subprocess = subprocess
-        self._queues = {
-            "streams": Queue(),
-            "lines": Queue(),
-        }
-        self._threads = {
-            stream_name: threading.Thread(
-                target=self.enqueue_stream,
-                args=(self._subprocess, stream_name, self._queues["streams"]),
-            )
-            for stream_name in ("stdout", "stderr")
-        }
-        self._threads["watcher"] = threading.Thread(
-            target=self.process_output_lines,
-            args=(self._queues["streams"], self._queues["lines"]),
+        self.streaming = streaming
+        self.timeout = timeout
+        self.kill_after = kill_after
+        self.tail = _TailBuffer(
+            tail_lines if bounded else 0, tail_chars, sizeof=_tail_item_size
         )
+        self.stdout_file = None  # type: Optional[IO[str]]
+        self.stderr_file = None  # type: Optional[IO[str]]
+        if spill_to_disk:
+            self.stdout_file = self._create_spill_file("stdout")
+            self.stderr_file = self._create_spill_file("stderr")
+        self._subprocess = subprocess
+        # Bounding the queue makes the readers (and so the child) wait for the
+        # consumer, keeping memory use constant
+        self._lines = Queue(maxsize=self.max_queued_lines if bounded or streaming else 0)
+        self._stream_names = []
+        self._finished_streams = set()  # type: Set[str]
+        self._decoders = {}  # type: Dict[str, io.IncrementalNewlineDecoder]
+        self._partial_lines = {}  # type: Dict[str, List[str]]
+        self._threads = {}
+        # Set once nobody reads the output anymore, the readers then drop what is left
+        # and close the pipes on their next wakeup
+        self._abandoned = False
         self.start_threads()
 
+    @classmethod
+    def _create_spill_file(cls, stream_name):
+        # type: (str) -> IO[str]
+        from .path import create_tracked_tempfile
+
+        return create_tracked_tempfile(
+            mode="w+",
+            encoding="utf-8",
+            errors="backslashreplace",
+            prefix="vistir-",
+            suffix="-{}.log".format(stream_name),
+        )
+
+    def _record_line(self, stream_name, text_line):
+        # type: (str, str) -> None
+        self.tail.append((stream_name, text_line))
+        spill_file = getattr(self, "{}_file".format(stream_name))
+        if spill_file is not None:
+            spill_file.write(text_line)
+            spill_file.write("\n")
+
+    def _rewind_spill_files(self):
+        # type: () -> None
+        for spill_file in (self.stdout_file, self.stderr_file):
+            if spill_file is not None:
+                spill_file.flush()
+                spill_file.seek(0)
+
+    def _get_stream_fileno(self, stream_name):
+        # type: (str) -> Optional[int]
+        stream = getattr(self._subprocess, stream_name, None)
+        try:
+            return stream.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def _create_decoder(self, stream_name):
+        # type: (str) -> io.IncrementalNewlineDecoder
+        if stream_name == "stdout":
+            encoding = self.stdout_encoding
+        else:
+            encoding = self.stderr_encoding
+        decoder = codecs.getincrementaldecoder(encoding)(errors="backslashreplace")
+        # Translate newlines the same way the text mode pipes of `run` do
+        return io.IncrementalNewlineDecoder(decoder, translate=True)
+
+    def _feed(self, stream_name, data, queue, final=False):
+        # type: (str, bytes, Queue, bool) -> None
+        """Decode a chunk of raw output and queue every line it completes."""
+        if self._abandoned:
+            return
+        text = self._decoders[stream_name].decode(data, final=final)
+        partial = self._partial_lines[stream_name]
+        if "\n" in text:
+            lines = text.split("\n")
+            lines[0] = "".join(partial) + lines[0]
+            partial[:] = [lines.pop()]
+            for line in lines:
+                queue.put((stream_name, line))
+        elif text:
+            partial.append(text)
+        if final:
+            last_line = "".join(partial)
+            if last_line:
+                queue.put((stream_name, last_line))
+            queue.put((stream_name, None))
+
     def enqueue_stream(self, proc, stream_name, queue):
         # type: (subprocess.Popen, str, Queue) -> None
-        if not getattr(proc, stream_name, None):
-            queue.put(("stderr", None))
-        else:
-            for line in iter(getattr(proc, stream_name).readline, ""):
+        """Blocking reader used for a single stream when the pipes can't be selected
+        on."""
+        stream = getattr(proc, stream_name, None)
+        raw_stream = getattr(stream, "buffer", None)
+        if raw_stream is not None and hasattr(raw_stream, "read1"):
+            for chunk in iter(lambda: raw_stream.read1(self.read_size), b""):
+                if self._abandoned:
+                    break
+                self._feed(stream_name, chunk, queue)
+            self._feed(stream_name, b"", queue, final=True)
+            stream.close()
+            return
+        if stream is not None:
+            for line in iter(stream.readline, ""):
+                if self._abandoned:
+                    break
                 queue.put((stream_name, line))
-            getattr(proc, stream_name).close()
+            stream.close()
+        queue.put((stream_name, None))
+
+    def pump_streams(self, proc, stream_names, queue):
+        # type: (subprocess.Popen, List[str], Queue) -> None
+        """Read every pipe of *proc* from a single thread, sleeping in
+        :func:`select` until one of them has data or reaches EOF."""
+        selector = selectors.DefaultSelector()
+        for stream_name in stream_names:
+            fileno = self._get_stream_fileno(stream_name)
+            selector.register(fileno, selectors.EVENT_READ, stream_name)
+        try:
+            while selector.get_map() and not self._abandoned:
+                for key, _ in selector.select():
+                    stream_name = key.data
+                    chunk = os.read(key.fd, self.read_size)
+                    if not chunk:
+                        selector.unregister(key.fd)
+                        self._feed(stream_name, b"", queue, final=True)
+                        getattr(proc, stream_name).close()
+                        continue
+                    self._feed(stream_name, chunk, queue)
+        finally:
+            # Only abandoned pipes are still open here
+            for key in list(selector.get_map().values()):
+                getattr(proc, key.data).close()
+            selector.close()
 
     @property
     def stderr(self):
@@ -247,24 +528,124 @@ class SubprocessStreamWrapper(object):
             self._iterated_stderr = iter(self.stderr.readline, "")
         return self._iterated_stderr
 
-    def _decode_line(self, line, encoding):
-        # type: (Union[str, bytes], str) -> str
-        if isinstance(line, bytes):
-            line = to_text(
-                line.decode(encoding, errors=_fs_decode_errors).encode(
-                    "utf-8", errors=_fs_encode_errors
-                ),
-                errors="backslashreplace",
+    def start_threads(self):
+        self._stream_names = stream_names = [
+            stream_name
+            for stream_name in ("stdout", "stderr")
+            if getattr(self._subprocess, stream_name, None) is not None
+        ]
+        for stream_name in stream_names:
+            self._decoders[stream_name] = self._create_decoder(stream_name)
+            self._partial_lines[stream_name] = []
+        filenos = [self._get_stream_fileno(name) for name in stream_names]
+        # Windows pipes can't be passed to select(), fall back to one blocking
+        # reader per stream there (and for file-like objects without a fileno)
+        if stream_names and os.name != "nt" and None not in filenos:
+            self._threads["reader"] = threading.Thread(
+                target=self.pump_streams,
+                args=(self._subprocess, stream_names, self._lines),
             )
         else:
-            line = to_text(line, encoding=encoding, errors=_fs_encode_errors)
-        return line
-
-    def start_threads(self):
+            for stream_name in stream_names:
+                self._threads[stream_name] = threading.Thread(
+                    target=self.enqueue_stream,
+                    args=(self._subprocess, stream_name, self._lines),
+                )
         for thread in self._threads.values():
             thread.daemon = True
             thread.start()
 
+    def iter_lines(self):
+        # type: () -> Iterator[Tuple[str, str]]
+        """Yield ``(stream_name, line)`` tuples as the subprocess writes them.
+
+        Lines are handed over as they are read and only the last ``tail_lines`` of them
+        are retained (in :attr:`tail`), so memory use does not grow with the output. If
+        the consumer stops iterating early the subprocess and the rest of its process
+        group are terminated.
+
+        :raises subprocess.TimeoutExpired: If the subprocess outlives ``timeout``, after
+            terminating it.
+        """
+        remaining = set(self._stream_names)
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+        try:
+            while remaining:
+                stream_name, line = self._get_queued_line(deadline)
+                if line is None:
+                    remaining.discard(stream_name)
+                    continue
+                text_line = line.rstrip()
+                self._record_line(stream_name, text_line)
+                yield stream_name, text_line
+        finally:
+            if remaining:
+                self._stop_reading(remaining)
+            self._subprocess.wait()
+            self._rewind_spill_files()
+
+    def _stop_reading(self, remaining):
+        # type: (Set[str]) -> None
+        """Terminate the process group of the subprocess and discard the rest of its
+        output until the *remaining* streams reach EOF, abandoning them after
+        :attr:`close_timeout` seconds if a process outside the group holds them open."""
+        if self.poll() is None:
+            _terminate_subprocess(self._subprocess, self.kill_after)
+        else:
+            # Also reap anything the leader left behind in its group
+            _signal_subprocess(self._subprocess, force=True)
+        deadline = time.monotonic() + self.close_timeout
+        while remaining:
+            try:
+                stream_name, line = self._lines.get(
+                    timeout=max(deadline - time.monotonic(), 0)
+                )
+            except Empty:
+                break
+            if line is None:
+                remaining.discard(stream_name)
+        if remaining:
+            self._abandoned = True
+            # Unblock a reader waiting for room in the queue
+            while True:
+                try:
+                    self._lines.get_nowait()
+                except Empty:
+                    break
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def _get_queued_line(self, deadline=None):
+        # type: (Optional[float]) -> Tuple[str, Optional[str]]
+        if deadline is None:
+            return self._lines.get()
+        try:
+            return self._lines.get(timeout=max(deadline - time.monotonic(), 0))
+        except Empty:
+            _terminate_subprocess(self._subprocess, self.kill_after)
+            raise subprocess.TimeoutExpired(
+                self._subprocess.args,
+                self.timeout,
+                output="\n".join(line for name, line in self.tail if name == "stdout"),
+                stderr="\n".join(line for name, line in self.tail if name == "stderr"),
+            )
+
+    def terminate(self, kill_after=5):
+        # type: (Optional[float]) -> None
+        """Terminate the subprocess (and its process group when it was started with a
+        timeout or to stream), killing it after *kill_after* seconds, then collect its
+        output."""
+        _terminate_subprocess(self._subprocess, kill_after)
+        self.gather_output()
+
+    def join_threads(self, timeout=None):
+        # type: (Optional[float]) -> None
+        for thread in self._threads.values():
+            thread.join(timeout)
+
     @property
     def subprocess(self):
         return self._subprocess
@@ -295,11 +676,19 @@ class SubprocessStreamWrapper(object):
 
     def wait(self, timeout=None):
         # type: (self, Optional[int]) -> Optional[int]
-        kwargs = {}
-        if sys.version_info[0] >= 3:
-            kwargs = {"timeout": timeout}
-        result = self._subprocess.wait(**kwargs)
+        """Wait for the subprocess to exit, collecting its output as it is written.
+
+        :raises subprocess.TimeoutExpired: If the subprocess outlives *timeout*.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        self._consume_lines(block=True, deadline=deadline)
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0)
+        result = self._subprocess.wait(timeout=timeout)
         self.gather_output()
+        self._rewind_spill_files()
         return result
 
     @property
@@ -361,59 +750,87 @@ class SubprocessStreamWrapper(object):
         # type: (Optional[str]) -> bool
         return line is not None and line != ""
 
-    def get_line(self, queue):
-        # type: (Queue) -> Tuple[Optional[str], ...]
-        stream, result = None, None
-        try:
-            stream, result = queue.get_nowait()
-        except Empty:
-            result = None
-        return stream, result
-
-    def process_output_lines(self, recv_queue, line_queue):
-        # type: (Queue, Queue) -> None
-        stream, line = self.get_line(recv_queue)
-        while self.poll() is None or line is not None:
-            if self.check_line_content(line):
-                line = to_text("{}".format(line).rstrip())
-                line_queue.put((stream, line))
-            stream, line = self.get_line(recv_queue)
-
     def gather_output(self, spinner=None, stdout_allowed=False, verbose=False):
         # type: (Optional[VistirSpinner], bool, bool) -> None
         if not getattr(self._subprocess, "out", None):
             self._subprocess.out = ""
         if not getattr(self._subprocess, "err", None):
             self._subprocess.err = ""
-        if not self._queues["streams"].empty():
-            self.process_output_lines(self._queues["streams"], self._queues["lines"])
-        while not self._queues["lines"].empty():
+        # Once the process has exited the readers only have buffered pipe
+        # contents left to consume, wait for them so no output is dropped
+        self._consume_lines(
+            block=self.subprocess_finished,
+            spinner=spinner,
+            stdout_allowed=stdout_allowed,
+            verbose=verbose,
+        )
+        if self.subprocess_finished:
+            self.join_threads()
+        self.out = "\n".join(self.text_stdout_lines).strip()
+        self.err = "\n".join(self.text_stderr_lines).strip()
+
+    def _consume_lines(
+        self,
+        block=False,  # type: bool
+        deadline=None,  # type: Optional[float]
+        spinner=None,  # type: Optional[VistirSpinner]
+        stdout_allowed=None,  # type: Optional[bool]
+        verbose=None,  # type: Optional[bool]
+    ):
+        # type: (...) -> None
+        """Handle queued lines, until every stream has reached EOF if *block* is set or
+        else until the queue is empty. Defaults to the spinner and output settings the
+        wrapper was created with.
+
+        :raises subprocess.TimeoutExpired: If *deadline* passes while blocking.
+        """
+        if spinner is None:
+            spinner = self.spinner
+        if stdout_allowed is None:
+            stdout_allowed = self.stdout_allowed
+        if verbose is None:
+            verbose = self.verbose
+        while len(self._finished_streams) < len(self._stream_names):
             try:
-                stream_name, line = self._queues["lines"].get()
+                if not block:
+                    stream_name, line = self._lines.get_nowait()
+                elif deadline is None:
+                    stream_name, line = self._lines.get()
+                else:
+                    stream_name, line = self._lines.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
             except Empty:
-                if not self._threads["watcher"].is_active():
-                    break
-                pass
-            if stream_name == "stdout":
-                text_line = self._decode_line(line, self.stdout_encoding)
-                self.text_stdout_lines.append(text_line)
-                self.out += "{}\n".format(text_line)
-                if verbose:
-                    _write_subprocess_result(
-                        line, "stdout", spinner=spinner, stdout_allowed=stdout_allowed
+                if block:
+                    raise subprocess.TimeoutExpired(
+                        self._subprocess.args, self.timeout
                     )
-            else:
-                text_err = self._decode_line(line, self.stderr_encoding)
-                self.text_stderr_lines.append(text_err)
-                self.update_display_line(line)
-                self.err += "{}\n".format(text_err)
+                break
+            if line is None:
+                self._finished_streams.add(stream_name)
+                continue
+            self._handle_line(stream_name, line, spinner, stdout_allowed, verbose)
+
+    def _handle_line(self, stream_name, line, spinner, stdout_allowed, verbose):
+        # type: (str, str, Optional[VistirSpinner], bool, bool) -> None
+        if stream_name == "stdout":
+            text_line = line.rstrip()
+            self.text_stdout_lines.append(text_line)
+            self._record_line(stream_name, text_line)
+            if verbose:
                 _write_subprocess_result(
-                    line, "stderr", spinner=spinner, stdout_allowed=stdout_allowed
+                    text_line, "stdout", spinner=spinner, stdout_allowed=stdout_allowed
                 )
-            if spinner:
-                spinner.text = "{} {}".format(spinner.text, self.display_line)
-        self.out = self.out.strip()
-        self.err = self.err.strip()
+        else:
+            text_err = line.rstrip()
+            self.text_stderr_lines.append(text_err)
+            self._record_line(stream_name, text_err)
+            self.update_display_line(text_err)
+            _write_subprocess_result(
+                text_err, "stderr", spinner=spinner, stdout_allowed=stdout_allowed
+            )
+        if spinner:
+            spinner.text = "{} {}".format(spinner.text, self.display_line)
 
 
 def _write_subprocess_result(result, stream_name, spinner=None, stdout_allowed=False):
@@ -430,7 +847,14 @@ def _write_subprocess_result(result, stream_name, spinner=None, stdout_allowed=F
 
 
 def attach_stream_reader(
-    cmd_instance, verbose, maxlen, spinner=None, stdout_allowed=False
+    cmd_instance,
+    verbose,
+    maxlen,
+    spinner=None,
+    stdout_allowed=False,
+    tail_lines=None,
+    tail_chars=None,
+    spill_to_disk=False,
 ):
     streams = SubprocessStreamWrapper(
         subprocess=cmd_instance,
@@ -438,14 +862,24 @@ def attach_stream_reader(
         spinner=spinner,
         verbose=verbose,
         stdout_allowed=stdout_allowed,
+        tail_lines=tail_lines,
+        tail_chars=tail_chars,
+        spill_to_disk=spill_to_disk,
     )
     streams.gather_output(spinner=spinner, verbose=verbose, stdout_allowed=stdout_allowed)
     return streams
 
 
-def _handle_nonblocking_subprocess(c, spinner=None):
-    while c.running:
-        c.wait()
+def _handle_nonblocking_subprocess(c, spinner=None, timeout=None, kill_after=5):
+    try:
+        c.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        c.terminate(kill_after=kill_after)
+        if spinner:
+            spinner.fail("Timed out...cleaning up...")
+        raise subprocess.TimeoutExpired(
+            c.subprocess.args, timeout, output=c.out, stderr=c.err
+        )
     if spinner:
         if c.returncode != 0:
             spinner.fail("Failed...cleaning up...")
@@ -469,9 +903,18 @@ def _create_subprocess(
     start_text="",
     write_to_stdout=True,
     encoding="utf-8",
+    stream=False,
+    tail_lines=None,
+    tail_chars=None,
+    spill_to_disk=False,
+    timeout=None,
+    kill_after=5,
 ):
     if not env:
         env = os.environ.copy()
+    # Bounded capture needs the line readers, communicate() would buffer everything
+    if stream or spill_to_disk or tail_lines is not None or tail_chars is not None:
+        block = False
     try:
         c = _spawn_subprocess(
             cmd,
@@ -480,6 +923,8 @@ def _create_subprocess(
             cwd=cwd,
             combine_stderr=combine_stderr,
             encoding=encoding,
+            # A stream which is closed early must be able to stop the whole tree
+            new_session=stream or timeout is not None,
         )
     except Exception as exc:  # pragma: no cover
         import traceback
@@ -490,6 +935,20 @@ def _create_subprocess(
         )
         sys.stderr.write(formatted_tb)
         raise exc
+    if stream:
+        c.stdin.close()
+        c = SubprocessStreamWrapper(
+            subprocess=c,
+            streaming=True,
+            tail_lines=tail_lines,
+            tail_chars=tail_chars,
+            spill_to_disk=spill_to_disk,
+            timeout=timeout,
+            kill_after=kill_after,
+        )
+        if not return_object:
+            return c.iter_lines()
+        return c
     if not block:
         c.stdin.close()
         spinner_orig_text = ""
@@ -503,11 +962,16 @@ def _create_subprocess(
             maxlen=display_limit,
             spinner=spinner,
             stdout_allowed=write_to_stdout,
+            tail_lines=tail_lines,
+            tail_chars=tail_chars,
+            spill_to_disk=spill_to_disk,
+        )
+        _handle_nonblocking_subprocess(
+            c, spinner, timeout=timeout, kill_after=kill_after
         )
-        _handle_nonblocking_subprocess(c, spinner)
     else:
         try:
-            c.out, c.err = c.communicate()
+            _communicate_with_timeout(c, timeout=timeout, kill_after=kill_after)
         except (SystemExit, KeyboardInterrupt, TimeoutError):  # pragma: no cover
             c.terminate()
             c.out, c.err = c.communicate()
@@ -517,6 +981,42 @@ def _create_subprocess(
     return c
 
 
+def _communicate_with_timeout(c, timeout=None, kill_after=5):
+    # type: (subprocess.Popen, Optional[float], Optional[float]) -> None
+    """Collect the output of *c* into its ``out`` and ``err`` attributes, terminating
+    its process group if it outlives *timeout* and killing it *kill_after* seconds
+    later.
+
+    :raises subprocess.TimeoutExpired: If *c* timed out, with its output attached.
+    """
+    try:
+        c.out, c.err = c.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # communicate() keeps what it read so far and returns all of it later
+        _signal_subprocess(c)
+        try:
+            c.out, c.err = c.communicate(timeout=kill_after)
+        except subprocess.TimeoutExpired:
+            _signal_subprocess(c, force=True)
+            c.out, c.err = c.communicate()
+        else:
+            # Also reap anything the leader left behind in its group
+            _signal_subprocess(c, force=True)
+        raise subprocess.TimeoutExpired(
+            c.args, timeout, output=c.out.strip(), stderr=c.err.strip()
+        )
+
+
+def _get_subprocess_env(env=None):
+    # type: (Optional[Dict[str, str]]) -> Dict[str, str]
+    _env = os.environ.copy()
+    _env["PYTHONIOENCODING"] = str("utf-8")
+    _env["PYTHONUTF8"] = str("1")
+    if env:
+        _env.update(env)
+    return {k: v for k, v in _env.items()}
+
+
 def run(
     cmd,
     env=None,
@@ -530,6 +1030,12 @@ def run(
     display_limit=200,
     write_to_stdout=True,
     encoding="utf-8",
+    stream=False,
+    tail_lines=None,
+    tail_chars=None,
+    spill_to_disk=False,
+    timeout=None,
+    kill_after=5,
 ):
     """Use `subprocess.Popen` to get the output of a command and decode it.
 
@@ -549,20 +1055,35 @@ def run(
         spinner.
     :param bool write_to_stdout: Whether to write to stdout when using a spinner,
         defaults to True.
-    :returns: A 2-tuple of (output, error) or a :class:`subprocess.Popen` object.
+    :param bool stream: When True, returns a generator of ``(stream_name, line)``
+        tuples which yields output as it is produced instead of collecting it. The
+        command leads its own process group, which is terminated if the generator is
+        closed early.
+    :param int tail_lines: Only keep the most recent *tail_lines* lines of each stream
+        in memory; ``out``, ``err`` and the ``tail`` of the returned object are
+        limited to them.
+    :param int tail_chars: Only keep the most recent lines of each stream adding up to
+        *tail_chars* characters in memory.
+    :param bool spill_to_disk: Write the complete output to tracked temporary files
+        exposed (rewound) as ``stdout_file`` and ``stderr_file`` of the returned object.
+        Unless a tail limit is given, only the last 1000 lines of each stream are kept
+        in memory.
+    :param float timeout: Seconds to wait for the command before terminating it along
+        with its process group, optional.
+    :param float kill_after: Seconds to wait after terminating a timed out command
+        before killing its process group, defaults to 5.
+    :raises subprocess.TimeoutExpired: If the command timed out, with the output
+        collected until then attached.
+    :returns: A 2-tuple of (output, error) or a :class:`subprocess.Popen` object. When
+        streaming, a generator of ``(stream_name, line)`` tuples, or with
+        *return_object* an iterable :class:`SubprocessStreamWrapper`.
 
     .. Warning:: Merging standard out and standard error in a nonblocking subprocess
         can cause errors in some cases and may not be ideal. Consider disabling
         this functionality.
     """
 
-    _env = os.environ.copy()
-    _env["PYTHONIOENCODING"] = str("utf-8")
-    _env["PYTHONUTF8"] = str("1")
-    if env:
-        _env.update(env)
-
-    _env = {k: v for k, v in _env.items()}
+    _env = _get_subprocess_env(env)
     if not spinner_name:
         spinner_name = "bouncingBar"
 
@@ -583,7 +1104,265 @@ def run(
         start_text=start_text,
         write_to_stdout=write_to_stdout,
         encoding=encoding,
+        stream=stream,
+        tail_lines=tail_lines,
+        tail_chars=tail_chars,
+        spill_to_disk=spill_to_disk,
+        timeout=timeout,
+        kill_after=kill_after,
+    )
+
+
+async def _read_stream_async(stream, chunks):
+    # type: (Optional[asyncio.StreamReader], List[bytes]) -> None
+    if stream is None:
+        return
+    chunk = await stream.read(SubprocessStreamWrapper.read_size)
+    while chunk:
+        chunks.append(chunk)
+        chunk = await stream.read(SubprocessStreamWrapper.read_size)
+
+
+async def _communicate_async(
+    c,  # type: asyncio.subprocess.Process
+    timeout=None,  # type: Optional[float]
+    kill_after=5,  # type: Optional[float]
+):
+    # type: (...) -> Tuple[bytes, bytes, bool]
+    """Collect the output of *c*, terminating it if it outlives *timeout* and killing
+    it *kill_after* seconds later.
+
+    Unlike :meth:`~asyncio.subprocess.Process.communicate` this keeps whatever was
+    read before the timeout, and kills the child if the caller is cancelled.
+    """
+    out, err = [], []  # type: List[bytes], List[bytes]
+    tasks = [
+        asyncio.ensure_future(_read_stream_async(c.stdout, out)),
+        asyncio.ensure_future(_read_stream_async(c.stderr, err)),
+        asyncio.ensure_future(c.wait()),
+    ]
+    timed_out = False
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            timed_out = True
+            _signal_subprocess(c)
+            await asyncio.wait([tasks[-1]], timeout=kill_after)
+            _signal_subprocess(c, force=True)
+            await asyncio.gather(*pending)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        if c.returncode is None:
+            c.kill()
+            await c.wait()
+        raise
+    return b"".join(out), b"".join(err), timed_out
+
+
+async def _run_async(
+    script,  # type: Script
+    env=None,  # type: Optional[Dict[str, str]]
+    cwd=None,  # type: Optional[Union[str, Path]]
+    combine_stderr=False,  # type: bool
+    encoding="utf-8",  # type: str
+    timeout=None,  # type: Optional[float]
+    kill_after=5,  # type: Optional[float]
+    running=None,  # type: Optional[Set[asyncio.subprocess.Process]]
+):
+    # type: (...) -> Tuple[asyncio.subprocess.Process, bool]
+    c = await _spawn_subprocess_async(
+        script,
+        env=env,
+        cwd=cwd,
+        combine_stderr=combine_stderr,
+        new_session=timeout is not None,
+    )
+    if running is not None:
+        running.add(c)
+    try:
+        out, err, timed_out = await _communicate_async(
+            c, timeout=timeout, kill_after=kill_after
+        )
+    finally:
+        if running is not None:
+            running.discard(c)
+    c.out = _decode_subprocess_output(out, encoding).strip()
+    c.err = _decode_subprocess_output(err, encoding).strip()
+    return c, timed_out
+
+
+async def run_async(
+    cmd,
+    env=None,
+    return_object=False,
+    cwd=None,
+    combine_stderr=False,
+    encoding="utf-8",
+    timeout=None,
+    kill_after=5,
+):
+    """Run a command on the running event loop and decode its output.
+
+    This is the :mod:`asyncio` counterpart of :func:`run`; the pipes are read by the
+    event loop rather than by reader threads.
+
+    :param list cmd: A list representing the command you want to run.
+    :param dict env: Additional environment settings to pass through to the subprocess.
+    :param bool return_object: When True, returns the finished
+        :class:`asyncio.subprocess.Process` instance with ``out`` and ``err`` set.
+    :param str cwd: Current working directory context to use for spawning the subprocess.
+    :param bool combine_stderr: Optionally merge stdout and stderr in the subprocess.
+    :param str encoding: The encoding used to decode the output, defaults to "utf-8".
+    :param float timeout: Seconds to wait for the command before terminating it along
+        with its process group, optional.
+    :param float kill_after: Seconds to wait after terminating a timed out command
+        before killing its process group, defaults to 5.
+    :raises subprocess.TimeoutExpired: If the command timed out, with the output
+        collected until then attached.
+    :returns: A 2-tuple of (output, error) or a :class:`asyncio.subprocess.Process`.
+
+    >>> out, err = asyncio.run(run_async(["python", "-c", "print('hello')"]))
+    >>> out
+    'hello'
+    """
+
+    if not isinstance(cmd, Script):
+        cmd = Script.parse(cmd)
+    c, timed_out = await _run_async(
+        cmd,
+        env=_get_subprocess_env(env),
+        cwd=cwd,
+        combine_stderr=combine_stderr,
+        encoding=encoding,
+        timeout=timeout,
+        kill_after=kill_after,
     )
+    if timed_out:
+        raise subprocess.TimeoutExpired(cmd._parts, timeout, output=c.out, stderr=c.err)
+    if not return_object:
+        return c.out, c.err
+    return c
+
+
+async def _run_async_limited(semaphore, script, **kwargs):
+    # type: (asyncio.Semaphore, Script, Any) -> asyncio.subprocess.Process
+    async with semaphore:
+        c, _ = await _run_async(script, **kwargs)
+    return c
+
+
+async def _create_semaphore(value):
+    # type: (int) -> asyncio.Semaphore
+    # Created from a coroutine so it binds to the loop that will use it
+    return asyncio.Semaphore(value)
+
+
+def run_many(
+    commands,
+    max_workers=None,
+    timeout=None,
+    cancel_on_failure=False,
+    env=None,
+    cwd=None,
+    combine_stderr=False,
+    encoding="utf-8",
+    kill_after=5,
+):
+    """Run several commands concurrently, yielding each one as it finishes.
+
+    All of the subprocesses are driven by a private event loop, so no threads are
+    spawned to read their output no matter how many commands are passed in.
+
+    :param commands: An iterable of commands (strings, lists or
+        :class:`~vistir.cmdparse.Script` instances) to run.
+    :param int max_workers: The maximum number of subprocesses to run at once, defaults
+        to ``min(32, os.cpu_count() + 4)``.
+    :param float timeout: Seconds each command may run before it is terminated,
+        optional.
+    :param bool cancel_on_failure: Stop after the first command which exits with a
+        non-zero return code (or times out), killing any commands still running.
+    :param dict env: Additional environment settings to pass through to the subprocesses.
+    :param str cwd: Current working directory context to use for spawning the subprocesses.
+    :param bool combine_stderr: Optionally merge stdout and stderr in the subprocesses.
+    :param str encoding: The encoding used to decode the output, defaults to "utf-8".
+    :param float kill_after: Seconds to wait after terminating a timed out command
+        before killing its process group, defaults to 5.
+    :returns: A generator of ``(command, process)`` tuples in order of completion, where
+        *process* is a finished :class:`asyncio.subprocess.Process` with ``out`` and
+        ``err`` set. Commands stopped after *timeout* have a non-zero return code.
+
+    >>> for cmd, c in run_many([["git", "fetch"], ["pip", "download", "six"]]):
+    ...     print(cmd, c.returncode)
+    ['pip', 'download', 'six'] 0
+    ['git', 'fetch'] 0
+    """
+
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) + 4)
+    if max_workers <= 0:
+        raise ValueError("max_workers must be greater than 0")
+    _env = _get_subprocess_env(env)
+    scripts = [
+        (cmd, cmd if isinstance(cmd, Script) else Script.parse(cmd)) for cmd in commands
+    ]
+    loop = asyncio.new_event_loop()
+    previous_loop = None
+    # Before 3.8 the default child watcher only follows the *current* event loop,
+    # so subprocesses started on a private loop would never be reaped
+    swap_loop = sys.version_info < (3, 8)
+    if swap_loop:
+        try:
+            previous_loop = asyncio.get_event_loop()
+        except RuntimeError:
+            pass
+        asyncio.set_event_loop(loop)
+    pending = set()
+    running = set()  # type: Set[asyncio.subprocess.Process]
+    try:
+        semaphore = loop.run_until_complete(_create_semaphore(max_workers))
+        tasks = {
+            loop.create_task(
+                _run_async_limited(
+                    semaphore,
+                    script,
+                    env=_env,
+                    cwd=cwd,
+                    combine_stderr=combine_stderr,
+                    encoding=encoding,
+                    timeout=timeout,
+                    kill_after=kill_after,
+                    running=running,
+                )
+            ): cmd
+            for cmd, script in scripts
+        }
+        pending = set(tasks)
+        while pending:
+            done, pending = loop.run_until_complete(
+                asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            )
+            for task in done:
+                c = task.result()
+                yield tasks[task], c
+                if cancel_on_failure and c.returncode != 0:
+                    return
+    finally:
+        if pending and sys.is_finalizing():
+            # The loop can no longer hear back from the child watcher at interpreter
+            # shutdown, so just make sure nothing outlives us
+            for c in running:
+                try:
+                    c.kill()
+                except ProcessLookupError:  # pragma: no cover
+                    pass
+        elif pending:
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+        if swap_loop:
+            asyncio.set_event_loop(previous_loop)
 
 
 def load_path(python):
@@ -663,80 +1442,166 @@ def partialclass(cls, *args, **kwargs):
 
 # Borrowed from django -- force bytes and decode -- see link for details:
 # https://github.com/django/django/blob/fc6b90b/django/utils/encoding.py#L112
-def to_bytes(string, encoding="utf-8", errors=None):
+def _get_default_errors(encoding):
+    # type: (str) -> str
+    """The error handler used by :func:`to_bytes` and :func:`to_text` when none is
+    given: lossless surrogate handling for utf-8, strict for anything else."""
+    if encoding in _UTF8_NAMES or get_canonical_encoding_name(encoding) == "utf-8":
+        if os.name == "nt":
+            return "surrogatepass"
+        return "surrogateescape"
+    return "strict"
+
+
+def _get_buffer_view(obj):
+    # type: (Any) -> Optional[memoryview]
+    """Return a flat byte-oriented :class:`memoryview` of a buffer-protocol object
+    (:class:`bytearray`, :class:`array.array`, :class:`mmap.mmap`...), or None.
+
+    The view shares the object's memory unless it isn't contiguous.
+    """
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return None
+    if not view.c_contiguous:
+        return memoryview(view.tobytes())
+    if view.format != "B" or view.ndim != 1:
+        view = view.cast("B")
+    return view
+
+
+def to_bytes(string, encoding="utf-8", errors=None, copy=True):
     """Force a value to bytes.
 
     :param string: Some input that can be converted to a bytes.
-    :type string: str or bytes unicode or a memoryview subclass
+    :type string: str or bytes unicode or any object supporting the buffer protocol,
+        e.g. a memoryview, bytearray, array or mmap
     :param encoding: The encoding to use for conversions, defaults to "utf-8"
     :param encoding: str, optional
+    :param bool copy: When False and the bytes of a buffer-protocol object can be used
+        as they are, return a :class:`memoryview` of them instead of a copy, defaults
+        to True.
     :return: Corresponding byte representation (for use in filesystem operations)
-    :rtype: bytes
+    :rtype: bytes or memoryview
     """
 
-    unicode_name = get_canonical_encoding_name("utf-8")
-    if not errors:
-        if get_canonical_encoding_name(encoding) == unicode_name:
-            if os.name == "nt":
-                errors = "surrogatepass"
-            else:
-                errors = "surrogateescape"
-        else:
-            errors = "strict"
+    unicode_name = "utf-8"
     if isinstance(string, bytes):
-        if get_canonical_encoding_name(encoding) == unicode_name:
+        if encoding in _UTF8_NAMES or get_canonical_encoding_name(encoding) == unicode_name:
             return string
-        else:
-            return string.decode(unicode_name).encode(encoding, errors)
-    elif isinstance(string, memoryview):
-        return string.tobytes()
-    elif not isinstance(string, str):  # pragma: no cover
-        try:
-            return str(string).encode(encoding, errors)
-        except UnicodeEncodeError:
-            if isinstance(string, Exception):
-                return b" ".join(to_bytes(arg, encoding, errors) for arg in string)
-            return str(string).encode(encoding, errors)
-    else:
+        if not errors:
+            errors = "strict"
+        return string.decode(unicode_name).encode(encoding, errors)
+    if not errors:
+        errors = _get_default_errors(encoding)
+    if isinstance(string, str):
         return string.encode(encoding, errors)
+    view = _get_buffer_view(string)
+    if view is not None:
+        if encoding in _UTF8_NAMES or get_canonical_encoding_name(encoding) == unicode_name:
+            return view.tobytes() if copy else view
+        return str(view, unicode_name).encode(encoding, errors)
+    try:
+        return str(string).encode(encoding, errors)
+    except UnicodeEncodeError:  # pragma: no cover
+        if isinstance(string, Exception):
+            return b" ".join(to_bytes(arg, encoding, errors) for arg in string)
+        return str(string).encode(encoding, errors)
 
 
 def to_text(string, encoding="utf-8", errors=None):
     """Force a value to a text-type.
 
     :param string: Some input that can be converted to a unicode representation.
-    :type string: str or bytes unicode
+    :type string: str or bytes unicode or any object supporting the buffer protocol
     :param encoding: The encoding to use for conversions, defaults to "utf-8"
     :param encoding: str, optional
     :return: The unicode representation of the string
     :rtype: str
     """
 
-    unicode_name = get_canonical_encoding_name("utf-8")
-    if not errors:
-        if get_canonical_encoding_name(encoding) == unicode_name:
-            if os.name == "nt":
-                errors = "surrogatepass"
-            else:
-                errors = "surrogateescape"
-        else:
-            errors = "strict"
     if issubclass(type(string), str):
         return string
+    if not errors:
+        errors = _get_default_errors(encoding)
     try:
-        if not issubclass(type(string), str):
-            if isinstance(string, bytes):
-                string = str(string, encoding, errors)
+        if isinstance(string, bytes):
+            string = str(string, encoding, errors)
+        else:
+            # Decode buffer-protocol objects in place rather than via a bytes copy
+            view = _get_buffer_view(string)
+            if view is not None:
+                string = str(view, encoding, errors)
             else:
                 string = str(string)
-
-        else:
-            string = string.decode(encoding, errors)
     except UnicodeDecodeError:  # pragma: no cover
         string = " ".join(to_text(arg, encoding, errors) for arg in string)
     return string
 
 
+def to_bytes_many(strings, encoding="utf-8", errors=None):
+    # type: (Iterable[Any], str, Optional[str]) -> List[bytes]
+    """Force every value of an iterable to bytes.
+
+    Equivalent to ``[to_bytes(s, encoding, errors) for s in strings]``, but the codec
+    and error handler are only resolved once for the whole batch.
+
+    :param strings: An iterable of values accepted by :func:`to_bytes`
+    :param str encoding: The encoding to use for conversions, defaults to "utf-8"
+    :param str errors: The error handler to use, optional
+    :return: A list of the corresponding byte representations
+    :rtype: list
+    """
+
+    is_unicode = encoding in _UTF8_NAMES or get_canonical_encoding_name(encoding) == "utf-8"
+    bytes_errors = errors or "strict"
+    if not errors:
+        errors = _get_default_errors(encoding)
+
+    def convert(string):
+        # type: (Any) -> bytes
+        string_type = type(string)
+        if string_type is str:
+            return string.encode(encoding, errors)
+        if string_type is bytes and is_unicode:
+            return string
+        if string_type is bytes:
+            return to_bytes(string, encoding, bytes_errors)
+        return to_bytes(string, encoding, errors)
+
+    return [convert(string) for string in strings]
+
+
+def to_text_many(strings, encoding="utf-8", errors=None):
+    # type: (Iterable[Any], str, Optional[str]) -> List[str]
+    """Force every value of an iterable to a text-type.
+
+    Equivalent to ``[to_text(s, encoding, errors) for s in strings]``, but the codec
+    and error handler are only resolved once for the whole batch.
+
+    :param strings: An iterable of values accepted by :func:`to_text`
+    :param str encoding: The encoding to use for conversions, defaults to "utf-8"
+    :param str errors: The error handler to use, optional
+    :return: A list of the corresponding unicode representations
+    :rtype: list
+    """
+
+    if not errors:
+        errors = _get_default_errors(encoding)
+
+    def convert(string):
+        # type: (Any) -> str
+        string_type = type(string)
+        if string_type is str:
+            return string
+        if string_type is bytes:
+            return str(string, encoding, errors)
+        return to_text(string, encoding, errors)
+
+    return [convert(string) for string in strings]
+
+
 try:
     locale_encoding = locale.getdefaultlocale()[1] or "ascii"
 except Exception:
@@ -812,17 +1677,40 @@ def decode_for_output(output, target_stream=None, translation_map=None):
     return to_text(output, encoding=encoding, errors="replace")
 
 
+# Common spellings resolved without going through the codec registry at all
+_CANONICAL_ENCODING_NAMES = {
+    "utf-8": "utf-8",
+    "utf8": "utf-8",
+    "UTF-8": "utf-8",
+    "UTF8": "utf-8",
+    "ascii": "ascii",
+    "ASCII": "ascii",
+}
+_UTF8_NAMES = frozenset(
+    name for name, canonical in _CANONICAL_ENCODING_NAMES.items() if canonical == "utf-8"
+)
+
+
 def get_canonical_encoding_name(name):
     # type: (str) -> str
     """Given an encoding name, get the canonical name from a codec lookup.
 
+    Lookups are cached, so this is cheap to call repeatedly with the same names.
+
     :param str name: The name of the codec to lookup
     :return: The canonical version of the codec name
     :rtype: str
     """
 
-    import codecs
+    try:
+        return _CANONICAL_ENCODING_NAMES[name]
+    except KeyError:
+        return _lookup_canonical_encoding_name(name)
+
 
+@functools.lru_cache(maxsize=128)
+def _lookup_canonical_encoding_name(name):
+    # type: (str) -> str
     try:
         codec = codecs.lookup(name)
     except LookupError:
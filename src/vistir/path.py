@@ -7,16 +7,20 @@ import functools
 import locale
 import os
 import posixpath
+import re
 import shutil
 import stat
 import sys
+import threading
 import typing
 import time
 import unicodedata
 import warnings
 
+from collections import OrderedDict, deque, namedtuple
 from pathlib import Path
-from tempfile import NamedTemporaryFile, TemporaryDirectory
+from queue import Queue
+from tempfile import NamedTemporaryFile, TemporaryDirectory, mkdtemp
 from typing import Optional, Callable
 from urllib import parse as urllib_parse
 from urllib import request as urllib_request
@@ -29,7 +33,9 @@ if typing.TYPE_CHECKING:
         Any,
         AnyStr,
         ByteString,
+        Dict,
         Generator,
+        Iterable,
         Iterator,
         List,
         Text,
@@ -44,22 +50,32 @@ if typing.TYPE_CHECKING:
 
 __all__ = [
     "check_for_unc_path",
+    "classify_url",
     "get_converted_relative_path",
     "handle_remove_readonly",
     "normalize_path",
     "is_in_path",
+    "ParentPath",
+    "PathIndex",
+    "PathNormalizer",
     "is_file_url",
     "is_readonly_path",
     "is_valid_url",
+    "locate_upwards",
     "mkdir_p",
     "ensure_mkdir_p",
+    "find_upwards",
     "create_tracked_tempdir",
     "create_tracked_tempfile",
     "path_to_url",
+    "paths_to_urls",
     "rmtree",
+    "rmtree_async",
     "safe_expandvars",
     "set_write_bit",
     "url_to_path",
+    "urls_to_paths",
+    "wait_for_pending_deletions",
     "walk_up",
 ]
 
@@ -127,7 +143,234 @@ def is_in_path(path, parent):
     :rtype: bool
     """
 
-    return normalize_path(path).startswith(normalize_path(parent))
+    return _is_in_normalized_path(normalize_path(path), normalize_path(parent))
+
+
+def _is_in_normalized_path(path, parent):
+    # type: (str, str) -> bool
+    # Compare whole components so that "/foo/barbaz" is not inside "/foo/bar"
+    return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+
+def _split_normalized_path(path):
+    # type: (str) -> List[str]
+    return [part for part in path.split(os.sep) if part]
+
+
+if os.name == "nt":
+    _ENVIRONMENT_VARIABLE_RE = re.compile(r"\$(\w+|\{[^}]*\})|%([^%]+)%")
+    _HOME_VARIABLES = ("HOME", "USERPROFILE", "HOMEDRIVE", "HOMEPATH")
+else:
+    _ENVIRONMENT_VARIABLE_RE = re.compile(r"\$(\w+|\{[^}]*\})")
+    _HOME_VARIABLES = ("HOME",)
+
+
+class PathNormalizer(object):
+    """A caching version of :func:`normalize_path`.
+
+    Results are cached in least-recently-used order, keyed on the path as given
+    together with everything its normalization depends on: the current working
+    directory for relative paths, any environment variables the path references and
+    the home directory for paths starting with ``~``.  Changes to the filesystem itself
+    are not tracked, so call :meth:`invalidate` after e.g. replacing a symlinked
+    directory on Windows.
+
+    :param int maxsize: The maximum number of cached paths, or None for no limit,
+        defaults to 1024
+
+    >>> normalizer = PathNormalizer(maxsize=4096)
+    >>> normalizer("~/some/path")
+    '/home/user/some/path'
+    """
+
+    def __init__(self, maxsize=1024):
+        # type: (Optional[int]) -> None
+        self.maxsize = maxsize
+        self._cache = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        # type: (TPath) -> Text
+        path = str(path)
+        key = self._get_key(path)
+        result = self._cache.get(key)
+        if result is not None:
+            try:
+                self._cache.move_to_end(key)
+            except KeyError:  # evicted by another thread in the meantime
+                pass
+            return result
+        result = normalize_path(path)
+        if self.maxsize is None or self.maxsize > 0:
+            with self._lock:
+                self._cache[key] = result
+                if self.maxsize is not None and len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        return result
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._cache)
+
+    @staticmethod
+    def _get_key(path):
+        # type: (str) -> Tuple[Any, ...]
+        cwd = None if os.path.isabs(path) else os.getcwd()
+        if "$" not in path and "%" not in path and not path.startswith("~"):
+            return (path, cwd)
+        names = [
+            name.strip("{}")
+            for match in _ENVIRONMENT_VARIABLE_RE.findall(path)
+            for name in (match if isinstance(match, tuple) else (match,))
+            if name
+        ]
+        if path.startswith("~"):
+            names.extend(_HOME_VARIABLES)
+        return (path, cwd, tuple((name, os.environ.get(name)) for name in names))
+
+    def invalidate(self, path=None):
+        # type: (Optional[TPath]) -> None
+        """Drop cached results.
+
+        :param str path: Only drop results for this path as originally given, optional
+        """
+
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+                return
+            path = str(path)
+            for key in [key for key in self._cache if key[0] == path]:
+                del self._cache[key]
+
+
+class ParentPath(object):
+    """A parent root which is normalized once and can then be checked against many
+    paths, as with :func:`is_in_path`.
+
+    :param str parent: The parent path to check for membership in
+    :param normalizer: A callable used to normalize the paths being checked, such as a
+        :class:`PathNormalizer`, defaults to :func:`normalize_path`
+
+    >>> site_packages = ParentPath(sysconfig.get_path("purelib"))
+    >>> [fn for fn in installed_files if fn in site_packages]
+    """
+
+    def __init__(self, parent, normalizer=None):
+        # type: (TPath, Optional[Callable[[TPath], Text]]) -> None
+        self.normalizer = normalizer if normalizer is not None else normalize_path
+        self.path = self.normalizer(parent)
+
+    def __repr__(self):
+        # type: () -> str
+        return "{}({!r})".format(type(self).__name__, self.path)
+
+    def __contains__(self, path):
+        # type: (TPath) -> bool
+        return self.contains(path)
+
+    def contains(self, path):
+        # type: (TPath) -> bool
+        """Determine if the provided full path is in this parent root.
+
+        :param str path: The full path to check the location of.
+        :return: Whether the full path is a member of this parent.
+        :rtype: bool
+        """
+
+        return _is_in_normalized_path(self.normalizer(path), self.path)
+
+
+class PathIndex(object):
+    """An index of many parent roots which finds the roots containing a given path.
+
+    Roots are stored in a trie of normalized path components, so a lookup takes time
+    proportional to the depth of the path being checked rather than to the number of
+    roots, and only whole components are matched.
+
+    :param roots: The parent roots to index, optional
+    :param normalizer: A callable used to normalize roots and the paths being checked,
+        such as a :class:`PathNormalizer`, defaults to :func:`normalize_path`
+
+    >>> index = PathIndex(sys.path)
+    >>> index.find("/usr/lib/python3.8/site-packages/six.py")
+    '/usr/lib/python3.8/site-packages'
+    """
+
+    def __init__(self, roots=(), normalizer=None):
+        # type: (Iterable[TPath], Optional[Callable[[TPath], Text]]) -> None
+        self.normalizer = normalizer if normalizer is not None else normalize_path
+        self._trie = {}  # type: Dict[Optional[str], Any]
+        self._roots = []  # type: List[TPath]
+        for root in roots:
+            self.add(root)
+
+    def __repr__(self):
+        # type: () -> str
+        return "{}({!r})".format(type(self).__name__, self._roots)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._roots)
+
+    def __iter__(self):
+        # type: () -> Iterator[TPath]
+        return iter(self._roots)
+
+    def __contains__(self, path):
+        # type: (TPath) -> bool
+        return self.find(path) is not None
+
+    def add(self, root):
+        # type: (TPath) -> None
+        """Add a parent root to the index. Adding a root which normalizes to one already
+        present has no effect.
+
+        :param str root: The parent root to add
+        """
+
+        node = self._trie
+        for part in _split_normalized_path(self.normalizer(root)):
+            node = node.setdefault(part, {})
+        if None not in node:
+            # The None key marks a node which is itself a root
+            node[None] = root
+            self._roots.append(root)
+
+    def _iter_matches(self, path):
+        # type: (TPath) -> Iterator[TPath]
+        node = self._trie
+        if None in node:
+            yield node[None]
+        for part in _split_normalized_path(self.normalizer(path)):
+            node = node.get(part)
+            if node is None:
+                return
+            if None in node:
+                yield node[None]
+
+    def find(self, path):
+        # type: (TPath) -> Optional[TPath]
+        """Find the innermost indexed root which contains the given path.
+
+        :param str path: The full path to check the location of.
+        :return: The matching root as it was added, or None
+        :rtype: Optional[str]
+        """
+
+        innermost = deque(self._iter_matches(path), maxlen=1)
+        return innermost[0] if innermost else None
+
+    def find_all(self, path):
+        # type: (TPath) -> List[TPath]
+        """Find every indexed root which contains the given path.
+
+        :param str path: The full path to check the location of.
+        :return: The matching roots as they were added, outermost first
+        :rtype: List[str]
+        """
+
+        return list(self._iter_matches(path))
 
 
 def normalize_drive(path):
@@ -164,23 +407,62 @@ def path_to_url(path):
     >>> path_to_url("/home/user/code/myrepo/myfile.zip")
     'file:///home/user/code/myrepo/myfile.zip'
     """
-    from .misc import to_bytes
 
     if not path:
         return path  # type: ignore
-    normalized_path = Path(normalize_drive(os.path.abspath(path))).as_posix()
-    if os.name == "nt" and normalized_path[1] == ":":
+    return _absolute_path_to_url(os.path.abspath(path))
+
+
+def paths_to_urls(paths):
+    # type: (Iterable[TPath]) -> List[Text]
+    """Convert many local paths to file uris, as with :func:`path_to_url`.
+
+    The current directory is looked up once for the whole batch and paths which need
+    no quoting are passed through unchanged.
+
+    :param paths: Strings pointing to or representing local paths
+    :return: A list of `file://` uris for the same locations
+    :rtype: List[str]
+    """
+
+    cwd = None  # type: Optional[str]
+    urls = []
+    for path in paths:
+        if not path:
+            urls.append(path)
+            continue
+        path = os.fspath(path)
+        if not os.path.isabs(path):
+            if cwd is None:
+                cwd = os.getcwd()
+            path = os.path.join(cwd, path)
+        urls.append(_absolute_path_to_url(os.path.normpath(path)))
+    return urls
+
+
+# Characters which `quote` leaves untouched in a path
+_UNQUOTED_PATH_RE = re.compile(r"[A-Za-z0-9_.~/-]*")
+
+
+def _quote_path(path):
+    # type: (str) -> str
+    if _UNQUOTED_PATH_RE.fullmatch(path):
+        return path
+    # XXX: This enables us to handle half-surrogates that were never
+    # XXX: actually part of a surrogate pair, but were just incidentally
+    # XXX: passed in as a piece of a filename
+    return quote(path, errors="backslashreplace")
+
+
+def _absolute_path_to_url(path):
+    # type: (str) -> str
+    if os.name != "nt":
+        return "file://{}".format(_quote_path(path))
+    normalized_path = Path(normalize_drive(path)).as_posix()
+    if normalized_path[1:2] == ":":
         drive, _, path = normalized_path.partition(":")
-        # XXX: This enables us to handle half-surrogates that were never
-        # XXX: actually part of a surrogate pair, but were just incidentally
-        # XXX: passed in as a piece of a filename
-        quoted_path = quote(path, errors="backslashreplace")
-        return "file:///{}:{}".format(drive, quoted_path)
-    # XXX: This is also here to help deal with incidental dangling surrogates
-    # XXX: on linux, by making sure they are preserved during encoding so that
-    # XXX: we can urlencode the backslash correctly
-    # bytes_path = to_bytes(normalized_path, errors="backslashreplace")
-    return "file://{}".format(quote(path, errors="backslashreplace"))
+        return "file:///{}:{}".format(drive, _quote_path(path))
+    return "file://{}".format(_quote_path(normalized_path))
 
 
 def url_to_path(url):
@@ -190,31 +472,118 @@ def url_to_path(url):
     Follows logic taken from pip's equivalent function
     """
 
-    assert is_file_url(url), "Only file: urls can be converted to local paths"
-    _, netloc, path, _, _ = urllib_parse.urlsplit(url)
+    scheme, netloc, path, _, _ = urllib_parse.urlsplit(_get_url_text(url))
+    assert scheme == "file", "Only file: urls can be converted to local paths"
+    return _file_url_parts_to_path(netloc, path)
+
+
+def urls_to_paths(urls):
+    # type: (Iterable[str]) -> List[str]
+    """Convert many file urls to local filesystem paths, as with :func:`url_to_path`.
+
+    :param urls: Valid file urls
+    :raises ValueError: If any of the urls is not a file url
+    :return: A list of local filesystem paths
+    :rtype: List[str]
+    """
+
+    paths = []
+    for url in urls:
+        scheme, netloc, path, _, _ = urllib_parse.urlsplit(_get_url_text(url))
+        if scheme != "file":
+            raise ValueError("Only file: urls can be converted to local paths: {!r}".format(url))
+        paths.append(_file_url_parts_to_path(netloc, path))
+    return paths
+
+
+def _get_url_text(url):
+    # type: (Union[str, bytes]) -> str
+    if isinstance(url, str):
+        return url
+    from .misc import to_text
+
+    return to_text(url, encoding="utf-8")
+
+
+def _file_url_parts_to_path(netloc, path):
+    # type: (str, str) -> str
     # Netlocs are UNC paths
     if netloc:
         netloc = "\\\\" + netloc
+    # url2pathname also takes care of unquoting
+    return urllib_request.url2pathname(netloc + path)
 
-    path = urllib_request.url2pathname(netloc + path)
-    return urllib_parse.unquote(path)
+
+URLClassification = namedtuple("URLClassification", ["scheme", "is_file", "is_valid"])
+
+# Mirrors the handling of schemes and netlocs in `urllib.parse.urlsplit`
+_URL_STRIP_CHARS = "".join(chr(i) for i in range(0x21))
+_URL_UNSAFE_RE = re.compile(r"[\t\r\n]")
+_URL_SCHEME_CHARS = frozenset(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+-."
+)
+_URL_NETLOC_END_RE = re.compile("[/?#]")
+
+
+@functools.lru_cache(maxsize=512)
+def _classify_url(url):
+    # type: (str) -> URLClassification
+    url = url.lstrip(_URL_STRIP_CHARS)
+    if "\t" in url or "\r" in url or "\n" in url:
+        url = _URL_UNSAFE_RE.sub("", url)
+    scheme, sep, rest = url.partition(":")
+    if (
+        not sep
+        or not scheme
+        or not (scheme[0].isascii() and scheme[0].isalpha())
+        or not _URL_SCHEME_CHARS.issuperset(scheme)
+    ):
+        return URLClassification("", False, False)
+    scheme = scheme.lower()
+    netloc = ""
+    if rest[:2] == "//":
+        match = _URL_NETLOC_END_RE.search(rest, 2)
+        netloc = rest[2 : match.start()] if match else rest[2:]
+        if "[" in netloc or "]" in netloc:
+            # Leave validating bracketed IPv6 hosts to urlsplit
+            try:
+                netloc = urllib_parse.urlsplit(url).netloc
+            except ValueError:
+                netloc = ""
+    return URLClassification(scheme, scheme == "file", bool(netloc))
+
+
+def classify_url(url):
+    # type: (Union[str, bytes]) -> URLClassification
+    """Find the scheme of an url and whether it is a file url or a valid url, without
+    fully parsing it. Results are cached.
+
+    :param str url: The url to classify
+    :return: A `URLClassification` of *(scheme, is_file, is_valid)*, where `is_valid`
+        has the same meaning as for :func:`is_valid_url`
+    :rtype: URLClassification
+
+    >>> classify_url("https://pypi.org/simple")
+    URLClassification(scheme='https', is_file=False, is_valid=True)
+    """
+
+    if not url:
+        return URLClassification("", False, False)
+    return _classify_url(_get_url_text(url))
 
 
 def is_valid_url(url):
     # type: (Union[str, bytes]) -> bool
     """Checks if a given string is an url."""
-    from .misc import to_text
 
     if not url:
         return url  # type: ignore
-    pieces = urllib_parse.urlparse(to_text(url))
-    return all([pieces.scheme, pieces.netloc])
+    return classify_url(url).is_valid
 
 
 def is_file_url(url):
     # type: (Any) -> bool
     """Returns true if the given url is a file url."""
-    from .misc import to_text
 
     if not url:
         return False
@@ -223,8 +592,7 @@ def is_file_url(url):
             url = url.url
         except AttributeError:
             raise ValueError("Cannot parse url from unknown type: {!r}".format(url))
-    url = to_text(url, encoding="utf-8")
-    return urllib_parse.urlparse(url.lower()).scheme == "file"
+    return classify_url(url).is_file
 
 
 def is_readonly_path(fn):
@@ -338,13 +706,18 @@ def set_write_bit(fn: str) -> None:
     """Set read-write permissions for the current user on the target path. Fail
     silently if the path doesn't exist.
 
+    Directories are processed in a single top-down pass: each entry is examined using
+    the stat information cached by :func:`os.scandir`, only entries missing any of the
+    bits are changed, and symlinks are skipped rather than followed.
+
     :param str fn: The target filename or path
     :return: None
     """
-    if not os.path.exists(fn):
+    try:
+        file_stat = os.stat(fn)
+    except OSError:
         return
-    file_stat = os.stat(fn).st_mode
-    os.chmod(fn, file_stat | stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+    _add_write_bits(fn, file_stat)
     if os.name == "nt":
         from ._winconsole import get_current_user
 
@@ -382,23 +755,84 @@ def set_write_bit(fn: str) -> None:
             if not c.err and c.returncode == 0:
                 return
 
-    if not os.path.isdir(fn):
+    if not stat.S_ISDIR(file_stat.st_mode):
         for path in [fn, os.path.dirname(fn)]:
             try:
                 os.chflags(path, 0)
-            except AttributeError:
+            except (AttributeError, OSError):
                 pass
         return None
-    for root, dirs, files in os.walk(fn, topdown=False):
-        for dir_ in [os.path.join(root, d) for d in dirs]:
-            set_write_bit(dir_)
-        for file_ in [os.path.join(root, f) for f in files]:
-            set_write_bit(file_)
+    _set_write_bit_tree(fn)
+
+
+_ALL_PERMISSION_BITS = stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO
+_CHMOD_DIR_FD = os.chmod in os.supports_dir_fd and os.scandir in os.supports_fd
+
+
+def _add_write_bits(path, file_stat, dir_fd=None):
+    # type: (str, os.stat_result, Optional[int]) -> None
+    """Grant all permission bits and clear any file flags on *path*, skipping whichever
+    of those *file_stat* shows are already in place. When *dir_fd* is an open descriptor
+    of the parent directory the mode is changed relative to it."""
+    mode = stat.S_IMODE(file_stat.st_mode)
+    try:
+        if mode & _ALL_PERMISSION_BITS != _ALL_PERMISSION_BITS:
+            if dir_fd is None:
+                os.chmod(path, mode | _ALL_PERMISSION_BITS)
+            else:
+                os.chmod(
+                    os.path.basename(path), mode | _ALL_PERMISSION_BITS, dir_fd=dir_fd
+                )
+        if getattr(file_stat, "st_flags", 0) and hasattr(os, "chflags"):
+            os.chflags(path, 0)
+    except OSError:
+        pass
+
+
+def _set_write_bit_tree(root):
+    # type: (str) -> None
+    """Apply :func:`_add_write_bits` to everything below *root* in a single pass.
+
+    Directories are fixed before they are listed so that unreadable subtrees can still
+    be traversed, and where the platform allows it entries are changed relative to an
+    open descriptor of their parent instead of by full path."""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        dir_fd = None  # type: Optional[int]
+        try:
+            if _CHMOD_DIR_FD:
+                dir_fd = os.open(current, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+                entries = list(os.scandir(dir_fd))
+            else:
+                with os.scandir(current) as it:
+                    entries = list(it)
+        except OSError:
+            if dir_fd is not None:
+                os.close(dir_fd)
+            continue
+        try:
+            for entry in entries:
+                try:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if stat.S_ISLNK(entry_stat.st_mode):
+                    continue
+                path = os.path.join(current, entry.name)
+                _add_write_bits(path, entry_stat, dir_fd=dir_fd)
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    stack.append(path)
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
 
 
 def rmtree(directory: str,
            ignore_errors: bool = False,
-           onerror: Optional[Callable] = None) -> None :
+           onerror: Optional[Callable] = None,
+           workers: Optional[int] = None,
+           deferred: bool = False) -> None :
     """Stand-in for :func:`~shutil.rmtree` with additional error-handling.
 
     This version of `rmtree` handles read-only paths, especially in the case of index
@@ -407,53 +841,348 @@ def rmtree(directory: str,
     :param str directory: The target directory to remove
     :param bool ignore_errors: Whether to ignore errors, defaults to False
     :param func onerror: An error handling function, defaults to :func:`handle_remove_readonly`
+    :param int workers: When greater than 1, delete files concurrently on a pool of this
+        many threads, which is much faster for very large trees, optional
+    :param bool deferred: Whether to return immediately and delete the directory in the
+        background, see :func:`rmtree_async`, defaults to False
 
     .. note::
 
        Setting `ignore_errors=True` may cause this to silently fail to delete the path
     """
 
-    if onerror is None:
-        onerror = handle_remove_readonly
+    if deferred:
+        rmtree_async(
+            directory, ignore_errors=ignore_errors, onerror=onerror, workers=workers
+        )
+        return None
+    deferred_removals = None
+    if onerror is None or onerror is handle_remove_readonly:
+        # Retry everything which is in the way together once the tree has been walked
+        # instead of waiting on each path in turn
+        onerror = deferred_removals = _DeferredRemovals()
+    if ignore_errors:
+        onerror = _ignore_rmtree_error
     try:
-        shutil.rmtree(directory, ignore_errors=ignore_errors, onerror=onerror)
+        if workers and workers > 1 and not os.path.islink(directory):
+            _parallel_rmtree(directory, onerror, workers)
+        else:
+            shutil.rmtree(directory, onerror=onerror)
     except (IOError, OSError, FileNotFoundError, PermissionError) as exc:  # noqa:B014
         # Ignore removal failures where the file doesn't exist
         if exc.errno != errno.ENOENT:
             raise
+    if deferred_removals is not None and not ignore_errors:
+        deferred_removals.retry()
+
+
+_PENDING_DELETIONS = Queue()  # type: Queue
+_PENDING_DELETIONS_CONDITION = threading.Condition()
+_PENDING_DELETIONS_COUNT = 0
+_DELETION_WORKER = None  # type: Optional[threading.Thread]
 
 
-def _wait_for_files(path):  # pragma: no cover
-    # type: (Union[str, TPath]) -> Optional[List[TPath]]
-    """Retry with backoff up to 1 second to delete files from a directory.
+def rmtree_async(directory,  # type: str
+                 ignore_errors=False,  # type: bool
+                 onerror=None,  # type: Optional[Callable]
+                 workers=None,  # type: Optional[int]
+                 ):
+    # type: (...) -> Optional[str]
+    """Remove a directory tree in the background.
 
-    :param str path: The path to crawl to delete files from
+    The target is first renamed into a new hidden trash directory next to it, so it
+    disappears from its original location straight away, and is then deleted with
+    :func:`rmtree` on a background thread. Pending deletions are waited on when the
+    interpreter exits; use :func:`wait_for_pending_deletions` to wait for them sooner.
+
+    :param str directory: The target directory to remove
+    :param bool ignore_errors: Whether to ignore errors, defaults to False
+    :param func onerror: An error handling function, defaults to :func:`handle_remove_readonly`
+    :param int workers: Passed through to :func:`rmtree`, optional
+    :return: The path which will be deleted, or None if *directory* does not exist
+    :rtype: Optional[str]
+    """
+
+    global _PENDING_DELETIONS_COUNT
+    if not os.path.lexists(directory):
+        return None
+    target = _move_to_trash(directory)
+    with _PENDING_DELETIONS_CONDITION:
+        _PENDING_DELETIONS_COUNT += 1
+        _start_deletion_worker()
+    _PENDING_DELETIONS.put((target, ignore_errors, onerror, workers))
+    return target
+
+
+def wait_for_pending_deletions(timeout=None):
+    # type: (Optional[float]) -> bool
+    """Wait for deletions scheduled by :func:`rmtree_async` to finish.
+
+    :param float timeout: The maximum number of seconds to wait, optional
+    :return: Whether all pending deletions finished
+    :rtype: bool
+    """
+
+    with _PENDING_DELETIONS_CONDITION:
+        return _PENDING_DELETIONS_CONDITION.wait_for(
+            lambda: _PENDING_DELETIONS_COUNT == 0, timeout
+        )
+
+
+def _move_to_trash(directory):
+    # type: (str) -> str
+    """Rename *directory* into a new trash directory alongside it, returning the trash
+    directory, or *directory* itself if it cannot be moved."""
+    directory = os.path.abspath(directory)
+    parent, name = os.path.split(directory.rstrip(os.sep))
+    try:
+        trash = mkdtemp(prefix=".vistir-trash-", dir=parent)
+    except OSError:
+        return directory
+    try:
+        os.rename(directory, os.path.join(trash, name))
+    except OSError:
+        os.rmdir(trash)
+        return directory
+    return trash
+
+
+def _start_deletion_worker():
+    # type: () -> None
+    global _DELETION_WORKER
+    if _DELETION_WORKER is not None and _DELETION_WORKER.is_alive():
+        return
+    if _DELETION_WORKER is None:
+        atexit.register(wait_for_pending_deletions)
+    _DELETION_WORKER = threading.Thread(
+        target=_process_pending_deletions, name="vistir-rmtree", daemon=True
+    )
+    _DELETION_WORKER.start()
+
+
+def _process_pending_deletions():
+    # type: () -> None
+    global _PENDING_DELETIONS_COUNT
+    while True:
+        target, ignore_errors, onerror, workers = _PENDING_DELETIONS.get()
+        try:
+            rmtree(target, ignore_errors=ignore_errors, onerror=onerror, workers=workers)
+        except Exception as exc:
+            warnings.warn(
+                "Unable to remove {!r} in the background: {}".format(target, exc),
+                ResourceWarning,
+            )
+        finally:
+            with _PENDING_DELETIONS_CONDITION:
+                _PENDING_DELETIONS_COUNT -= 1
+                _PENDING_DELETIONS_CONDITION.notify_all()
+
+
+def _ignore_rmtree_error(func, path, exc):
+    # type: (Callable[..., Any], TPath, Tuple[Type[OSError], OSError, TracebackType]) -> None
+    return None
+
+
+def _scan_tree(directory, onerror):
+    # type: (str, Callable[..., Any]) -> Tuple[List[str], List[str]]
+    """List every non-directory entry under *directory* and every directory (including
+    *directory* itself), the latter ordered so that children precede their parents.
+    Symlinks to directories are treated as files and never followed."""
+    files, dirs = [], []  # type: List[str], List[str]
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        dirs.append(current)
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        stack.append(entry.path)
+                    else:
+                        files.append(entry.path)
+        except OSError:
+            onerror(os.scandir, current, sys.exc_info())
+    dirs.reverse()
+    return files, dirs
+
+
+def _unlink(path):
+    # type: (str) -> Optional[Tuple[Type[OSError], OSError, TracebackType]]
+    try:
+        os.unlink(path)
+    except OSError:
+        return sys.exc_info()  # type: ignore
+    return None
+
+
+def _parallel_rmtree(directory, onerror, workers):
+    # type: (str, Callable[..., Any], int) -> None
+    """Remove *directory*, unlinking its files on a pool of *workers* threads and then
+    removing its directories bottom-up. Only entries which fail are passed to
+    *onerror*, which runs on the calling thread once all the files have been tried;
+    with the default handler of :func:`rmtree` they are then retried together."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    files, dirs = _scan_tree(directory, onerror)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        failures = [
+            (path, exc_info)
+            for path, exc_info in zip(files, pool.map(_unlink, files))
+            if exc_info is not None
+        ]
+    for path, exc_info in failures:
+        onerror(os.unlink, path, exc_info)
+    for path in dirs:
+        try:
+            os.rmdir(path)
+        except OSError:
+            onerror(os.rmdir, path, sys.exc_info())
+
+
+def _wait_for_files(path, timeout=1.0, max_delay=0.25):
+    # type: (Union[str, TPath], float, float) -> Optional[List[str]]
+    """Retry with backoff to delete a file, or a directory and everything in it.
+
+    Every path which fails to be removed is retried together on the next round, with
+    the delay between rounds doubling up to *max_delay*, until nothing remains or
+    *timeout* seconds have passed in total.
+
+    :param str path: The path to delete
+    :param float timeout: The overall deadline in seconds, defaults to 1
+    :param float max_delay: The longest pause between two rounds, defaults to 0.25
     :return: A list of remaining paths or None
     :rtype: Optional[List[str]]
     """
-    timeout = 0.001
-    remaining = []
-    while timeout < 1.0:
-        remaining = []
-        if os.path.isdir(path):
-            L = os.listdir(path)
-            for target in L:
-                _remaining = _wait_for_files(target)
-                if _remaining:
-                    remaining.extend(_remaining)
-            continue
-        try:
+    return _remove_with_retries(_list_removals(os.fspath(path)), timeout, max_delay)
+
+
+def _list_removals(path):
+    # type: (str) -> List[Tuple[str, bool]]
+    """List what has to be removed for *path* to be gone, as pairs of a path and
+    whether it is a directory, with the contents of directories ahead of them."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        files, dirs = _scan_tree(path, _ignore_rmtree_error)
+        return [(p, False) for p in files] + [(p, True) for p in dirs]
+    return [(path, False)]
+
+
+def _remove_with_retries(pending, timeout=1.0, max_delay=0.25):
+    # type: (List[Tuple[str, bool]], float, float) -> Optional[List[str]]
+    """Remove each of the *pending* paths, retrying those which fail as described
+    in :func:`_wait_for_files`, and return the ones remaining at the deadline."""
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
+        # Directories follow their contents, so one round can clear a whole subtree
+        pending = [(p, is_dir) for p, is_dir in pending if not _try_remove(p, is_dir)]
+        if not pending:
+            return None
+        remaining_time = deadline - time.monotonic()
+        if remaining_time <= 0:
+            return [p for p, _ in pending]
+        time.sleep(min(delay, remaining_time))
+        delay = min(delay * 2, max_delay)
+
+
+def _try_remove(path, is_dir):
+    # type: (str, bool) -> bool
+    try:
+        if is_dir:
+            os.rmdir(path)
+        else:
             os.unlink(path)
-        except FileNotFoundError as e:
-            if e.errno == errno.ENOENT:
-                return
-        except (OSError, IOError, PermissionError):  # noqa:B014
-            time.sleep(timeout)
-            timeout *= 2
-            remaining.append(path)
+    except FileNotFoundError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _set_parent_write_bit(path):
+    # type: (str) -> None
+    """Make the directory containing *path* writable, which is what unlinking *path*
+    requires on POSIX systems. Unlike :func:`set_write_bit` the directory's contents
+    are left alone."""
+    parent = os.path.dirname(path)
+    try:
+        parent_stat = os.stat(parent)
+    except OSError:
+        return
+    _add_write_bits(parent, parent_stat)
+
+
+def _fix_removal_error(func, path, exc_exception):
+    # type: (Callable[..., Any], str, OSError) -> bool
+    """Grant the permissions which removing *path* with *func* failed for and try
+    again once, returning whether *path* is gone."""
+    if exc_exception.errno == errno.ENOENT:
+        return True
+    set_write_bit(path)
+    if func in (os.unlink, os.remove) and exc_exception.errno == errno.EACCES:
+        _set_parent_write_bit(path)
+    if func not in (os.unlink, os.remove, os.rmdir):
+        return False
+    try:
+        func(path)
+    except FileNotFoundError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class _DeferredRemovals(object):
+    """An error handler for :func:`shutil.rmtree` which fixes permissions straight
+    away, but rather than waiting on each path which is still in the way collects
+    them all to be retried together by :meth:`retry`, under a single deadline."""
+
+    PERM_ERRORS = (errno.EACCES, errno.EPERM, errno.ENOENT)
+
+    def __init__(self):
+        # type: () -> None
+        self.pending = []  # type: List[Tuple[str, bool]]
+
+    def __call__(self, func, path, exc):
+        # type: (Callable[..., Any], TPath, Tuple[Type[OSError], OSError, TracebackType]) -> None
+        path = os.fspath(path)
+        exc_exception = exc[1]
+        if exc_exception.errno in self.PERM_ERRORS:
+            if not _fix_removal_error(func, path, exc_exception):
+                self.pending.extend(_list_removals(path))
+        elif func is os.rmdir and self._has_pending_below(path):
+            # Not empty because of an entry which is waiting to be retried
+            self.pending.append((path, True))
         else:
-            return
-    return remaining
+            raise exc_exception
+
+    def _has_pending_below(self, path):
+        # type: (str) -> bool
+        prefix = os.path.join(path, "")
+        return any(p == path or p.startswith(prefix) for p, _ in self.pending)
+
+    def retry(self, timeout=1.0):
+        # type: (float) -> Optional[List[str]]
+        """Retry removing the collected paths for up to *timeout* seconds in total,
+        warning about any which remain.
+
+        :return: A list of remaining paths or None
+        """
+        remaining = _remove_with_retries(self.pending, timeout)
+        self.pending = []
+        if remaining:
+            warnings.warn(
+                "Unable to remove {} path(s) due to permissions restriction: {!r}".format(
+                    len(remaining), remaining
+                ),
+                ResourceWarning,
+                # Point at the caller of rmtree()
+                stacklevel=3,
+            )
+        return remaining
 
 
 def handle_remove_readonly(func, path, exc):
@@ -467,49 +1196,23 @@ def handle_remove_readonly(func, path, exc):
     :param str path: The target path for removal
     :param Exception exc: The raised exception
 
-    This function will call check :func:`is_readonly_path` before attempting to call
-    :func:`set_write_bit` on the target path and try again.
+    This function will call :func:`set_write_bit` on the target path, and on its
+    parent directory when a file could not be unlinked, and try again. When
+    :func:`rmtree` is called with the default error handler, paths which still can't
+    be removed are retried together once the whole tree has been walked.
     """
 
     PERM_ERRORS = (errno.EACCES, errno.EPERM, errno.ENOENT)
     default_warning_message = "Unable to remove file due to permissions restriction: {!r}"
     # split the initial exception out into its type, exception, and traceback
     exc_type, exc_exception, exc_tb = exc
-    if is_readonly_path(path):
-        # Apply write permission and call original function
-        set_write_bit(path)
-        try:
-            func(path)
-        except (  # noqa:B014
-            OSError,
-            IOError,
-            FileNotFoundError,
-            PermissionError,
-        ) as e:  # pragma: no cover
-            if e.errno in PERM_ERRORS:
-                if e.errno == errno.ENOENT:
-                    return
-                remaining = None
-                if os.path.isdir(path):
-                    remaining = _wait_for_files(path)
-                if remaining:
-                    warnings.warn(default_warning_message.format(path), ResourceWarning)
-                else:
-                    func(path, ignore_errors=True)
-                return
-
-    if exc_exception.errno in PERM_ERRORS:
-        set_write_bit(path)
-        remaining = _wait_for_files(path)
-        try:
-            func(path)
-        except (OSError, IOError, FileNotFoundError, PermissionError) as e:  # noqa:B014
-            if e.errno in PERM_ERRORS:
-                if e.errno != errno.ENOENT:  # File still exists
-                    warnings.warn(default_warning_message.format(path), ResourceWarning)
-            return
-    else:
+    if exc_exception.errno not in PERM_ERRORS:
         raise exc_exception
+    path = os.fspath(path)
+    if _fix_removal_error(func, path, exc_exception):
+        return
+    if _wait_for_files(path):  # Something still exists
+        warnings.warn(default_warning_message.format(path), ResourceWarning)
 
 
 def walk_up(bottom):
@@ -518,28 +1221,125 @@ def walk_up(bottom):
 
     From: https://gist.github.com/zdavkeos/1098474
     """
+    # Once resolved, each lexical parent is also the real parent
     bottom = os.path.realpath(str(bottom))
-    # Get files in current dir.
+    while True:
+        # Get files in current dir.
+        dirs, nondirs = [], []
+        try:
+            with os.scandir(bottom) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    (dirs if is_dir else nondirs).append(entry.name)
+        except OSError:
+            return
+        yield bottom, dirs, nondirs
+
+        new_path = os.path.dirname(bottom)
+        # See if we are at the top.
+        if new_path == bottom:
+            return
+        bottom = new_path
+
+
+def find_upwards(names, start=None):
+    # type: (Union[str, Iterable[str]], Optional[TPath]) -> Optional[str]
+    """Find the nearest file or directory with one of the given names in *start* or
+    any of its parents, like :func:`walk_up` but without listing each directory.
+
+    :param names: A name, or names in order of preference, to look for
+    :param str start: The directory to start in, defaults to the current directory
+    :return: The full path of the first match, or None
+    :rtype: Optional[str]
+
+    >>> find_upwards(["Pipfile", "pyproject.toml"])
+    '/home/user/code/myrepo/Pipfile'
+    """
+    if isinstance(names, str):
+        names = [names]
+    else:
+        names = list(names)
+    current = os.path.realpath(str(start) if start is not None else os.getcwd())
+    while True:
+        for name in names:
+            candidate = os.path.join(current, name)
+            if os.path.lexists(candidate):
+                return candidate
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+_LOCATE_UPWARDS_CACHE = {}  # type: Dict[Tuple[str, Tuple[str, ...]], Tuple[int, Optional[str]]]
+_LOCATE_UPWARDS_CACHE_SIZE = 4096
+# Directories modified this recently are not cached, as further changes within the
+# resolution of the filesystem's timestamps would go unnoticed
+_LOCATE_UPWARDS_RACY_SECONDS = 2.0
+
+
+def locate_upwards(marker_files, start=None):
+    # type: (Union[str, Iterable[str]], Optional[TPath]) -> Optional[str]
+    """A caching version of :func:`find_upwards` for repeated project root discovery.
+
+    Which of the markers each directory contains is remembered along with the
+    directory's modification time, so later lookups, including those starting from
+    sibling directories, only need a single ``stat`` call per shared ancestor.
+    Creating or removing an entry updates the modification time of its directory,
+    which invalidates the cached answer.
+
+    :param marker_files: A name, or names in order of preference, to look for
+    :param str start: The directory to start in, defaults to the current directory
+    :return: The full path of the first match, or None
+    :rtype: Optional[str]
+
+    >>> project_root = os.path.dirname(locate_upwards(["Pipfile", "pyproject.toml"]))
+    """
+    if isinstance(marker_files, str):
+        markers = (marker_files,)  # type: Tuple[str, ...]
+    else:
+        markers = tuple(marker_files)
+    current = os.path.realpath(str(start) if start is not None else os.getcwd())
+    while True:
+        found = _locate_marker(current, markers)
+        if found is not None:
+            return os.path.join(current, found)
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def _locate_marker(directory, markers):
+    # type: (str, Tuple[str, ...]) -> Optional[str]
     try:
-        names = os.listdir(bottom)
-    except Exception:
-        return
+        mtime = os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+    key = (directory, markers)
+    cached = _LOCATE_UPWARDS_CACHE.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    found = next(
+        (name for name in markers if os.path.lexists(os.path.join(directory, name))),
+        None,
+    )
+    if time.time() - mtime / 1e9 > _LOCATE_UPWARDS_RACY_SECONDS:
+        if len(_LOCATE_UPWARDS_CACHE) >= _LOCATE_UPWARDS_CACHE_SIZE:
+            _LOCATE_UPWARDS_CACHE.clear()
+        _LOCATE_UPWARDS_CACHE[key] = (mtime, found)
+    return found
 
-    dirs, nondirs = [], []
-    for name in names:
-        if os.path.isdir(os.path.join(bottom, name)):
-            dirs.append(name)
-        else:
-            nondirs.append(name)
-    yield bottom, dirs, nondirs
 
-    new_path = os.path.realpath(os.path.join(bottom, ".."))
-    # See if we are at the top.
-    if new_path == bottom:
-        return
+def _clear_locate_upwards_cache():
+    # type: () -> None
+    _LOCATE_UPWARDS_CACHE.clear()
+
 
-    for x in walk_up(new_path):
-        yield x
+locate_upwards.cache_clear = _clear_locate_upwards_cache  # type: ignore
 
 
 def check_for_unc_path(path):
@@ -1,4 +1,10 @@
 # -*- coding=utf-8 -*-
+import functools
+import http.server
+import io
+import os
+import threading
+
 import pytest
 from vistir.contextmanagers import replaced_stream
 
@@ -8,3 +14,103 @@ def capture_streams():
     with replaced_stream("stdout") as stdout:
         with replaced_stream("stderr") as stderr:
             yield (stdout, stderr)
+
+
+class LocalHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super(LocalHTTPRequestHandler, self).setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        return super(LocalHTTPRequestHandler, self).do_GET()
+
+    def do_HEAD(self):
+        if self.server.reject_head:
+            self.send_error(403)
+            return
+        return super(LocalHTTPRequestHandler, self).do_HEAD()
+
+    def send_response(self, code, message=None):
+        self.server.statuses.append(code)
+        super(LocalHTTPRequestHandler, self).send_response(code, message)
+
+    def send_head(self):
+        self.etag = None
+        path = self.translate_path(self.path)
+        if os.path.isfile(path):
+            path_stat = os.stat(path)
+            self.etag = '"{}-{}"'.format(path_stat.st_mtime_ns, path_stat.st_size)
+            if self.headers.get("If-None-Match") == self.etag:
+                self.send_response(304)
+                self.end_headers()
+                return None
+            if self.server.accept_ranges and self.headers.get("Range"):
+                return self.send_range(path, path_stat.st_size)
+        return super(LocalHTTPRequestHandler, self).send_head()
+
+    def send_range(self, path, size):
+        start, _, end = self.headers["Range"].partition("=")[2].partition("-")
+        start, end = int(start), min(int(end or size - 1), size - 1)
+        if self.server.misplace_ranges:
+            # Answer with the start of the file whatever was asked for
+            start, end = 0, end - start
+        with open(path, "rb") as fh:
+            fh.seek(start)
+            body = fh.read(end + 1 - start)
+        self.send_response(206)
+        self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, size))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.server.truncate_ranges > 0:
+            # Drop the connection half way through the body
+            self.server.truncate_ranges -= 1
+            self.close_connection = True
+            body = body[: len(body) // 2]
+        return io.BytesIO(body)
+
+    def end_headers(self):
+        if getattr(self, "etag", None):
+            self.send_header("ETag", self.etag)
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        super(LocalHTTPRequestHandler, self).end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server(tmpdir):
+    """Serve the contents of a temporary directory over HTTP on localhost.
+
+    The server records the number of connections accepted, each requested path and
+    the status of each response. Files are served with an `ETag` and `Last-Modified`
+    header and conditional requests are answered with ``304 Not Modified``. Setting
+    `accept_ranges` enables range requests, the first `truncate_ranges` of which are
+    cut off half way through, and `reject_head` answers ``HEAD`` requests with
+    ``403 Forbidden`` like urls presigned for ``GET`` only. With `misplace_ranges`
+    every range is served from the start of the file instead.
+    """
+    handler = functools.partial(LocalHTTPRequestHandler, directory=tmpdir.strpath)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.requests = []
+    server.statuses = []
+    server.accept_ranges = False
+    server.truncate_ranges = 0
+    server.reject_head = False
+    server.misplace_ranges = False
+    server.root = tmpdir
+    server.url = "http://127.0.0.1:{}".format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
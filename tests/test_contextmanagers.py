@@ -2,11 +2,13 @@
 from __future__ import absolute_import, print_function, unicode_literals
 
 import contextlib
+import hashlib
 import importlib
 import io
 import os
 import shutil
 import sys
+import time
 import warnings
 
 import pytest
@@ -295,7 +297,7 @@ def test_open_file_without_requests(monkeypatch, tmpdir, stream, use_requests, u
         else:
             yield
 
-    with monkeypatch.context() as m, patch_context():
+    with patch_context(), monkeypatch.context() as m:
         if not use_requests:
             m.delitem(sys.modules, "requests", raising=False)
             m.delitem(sys.modules, "requests.sessions", raising=False)
@@ -341,3 +343,268 @@ def test_replace_streams(capsys):
     out, err = capsys.readouterr()
     assert out.strip() != "hello"
     assert err.strip() != "this is an error"
+
+
+def test_open_file_reuses_pooled_sessions(http_server):
+    http_server.root.join("first.txt").write_binary(b"first file")
+    http_server.root.join("second.txt").write_binary(b"second file")
+    pool = contextmanagers.SessionPool(maxsize=1)
+    for name in ("first.txt", "second.txt", "first.txt"):
+        url = "{}/{}".format(http_server.url, name)
+        with contextmanagers.open_file(url, session=pool) as fp:
+            assert fp.read() == http_server.root.join(name).read_binary()
+    assert http_server.connections == 1
+    assert len(pool) == 1
+    with pool.session(http_server.url) as session:
+        assert len(pool) == 0
+        with pool.session(http_server.url) as other_session:
+            assert other_session is not session
+    assert len(pool) == 1
+    pool.clear()
+    assert len(pool) == 0
+
+
+def test_session_pool_evicts_idle_sessions(monkeypatch):
+    closed = []
+
+    class FakeSession(object):
+        def close(self):
+            closed.append(self)
+
+    pool = contextmanagers.SessionPool(idle_timeout=10, session_factory=FakeSession)
+    clock = [100.0]
+    monkeypatch.setattr(contextmanagers.time, "monotonic", lambda: clock[0])
+    session = pool.acquire("https://pypi.org/simple/")
+    pool.release("https://pypi.org/simple/", session)
+    assert pool.acquire("https://PyPI.org/other/") is session
+    pool.release("https://pypi.org/simple/", session)
+    clock[0] += 11
+    assert pool.acquire("https://files.pythonhosted.org/") is not session
+    assert closed == [session]
+
+
+@pytest.mark.parametrize("use_requests", [True, False])
+def test_open_file_cache_dir(http_server, tmpdir_factory, monkeypatch, use_requests):
+    cache_dir = tmpdir_factory.mktemp("cache")
+    served_file = http_server.root.join("package.tar.gz")
+    served_file.write_binary(b"original contents")
+    url = "{}/package.tar.gz".format(http_server.url)
+    if not use_requests:
+        monkeypatch.setitem(sys.modules, "requests", None)
+    for _ in range(2):
+        with contextmanagers.open_file(url, cache_dir=cache_dir.strpath) as fp:
+            assert isinstance(fp, io.BufferedReader)
+            assert fp.read() == b"original contents"
+    assert http_server.statuses == [200, 304]
+    served_file.write_binary(b"updated contents")
+    os.utime(served_file.strpath, (0, 0))
+    with contextmanagers.open_file(url, cache_dir=cache_dir.strpath) as fp:
+        assert fp.read() == b"updated contents"
+    assert http_server.statuses == [200, 304, 200]
+    cached = cache_dir.join("content").visit(fil=lambda p: p.isfile())
+    assert sorted(p.read_binary() for p in cached) == [
+        b"original contents",
+        b"updated contents",
+    ]
+
+
+def test_open_file_cache_dir_evicts_least_recently_used(http_server, tmpdir_factory):
+    cache_dir = tmpdir_factory.mktemp("cache")
+    for name in ("first", "second", "third"):
+        http_server.root.join(name).write_binary(name.encode() * 10)
+    for name in ("first", "second", "first", "third"):
+        url = "{}/{}".format(http_server.url, name)
+        with contextmanagers.open_file(
+            url, cache_dir=cache_dir.strpath, cache_size=100
+        ) as fp:
+            assert fp.read() == name.encode() * 10
+        time.sleep(0.01)
+    cached = cache_dir.join("content").visit(fil=lambda p: p.isfile())
+    assert sorted(p.read_binary() for p in cached) == [b"first" * 10, b"third" * 10]
+
+
+def test_open_file_cache_dir_evicted_by_another_process(
+    http_server, tmpdir_factory, monkeypatch
+):
+    cache_dir = tmpdir_factory.mktemp("cache")
+    http_server.root.join("package.tar.gz").write_binary(b"contents")
+    url = "{}/package.tar.gz".format(http_server.url)
+    store_cache_content = contextmanagers._store_cache_content
+    evictions = []
+
+    def evict(path):
+        evictions.append(path)
+        os.remove(path)
+
+    def store_and_evict(*args):
+        content_path = store_cache_content(*args)
+        if not evictions:
+            evict(content_path)
+        return content_path
+
+    monkeypatch.setattr(contextmanagers, "_store_cache_content", store_and_evict)
+    with contextmanagers.open_file(url, cache_dir=cache_dir.strpath) as fp:
+        assert fp.read() == b"contents"
+    assert http_server.statuses == [200, 200]
+    http_get = contextmanagers._http_get
+
+    @contextlib.contextmanager
+    def revalidate_and_evict(link, session, headers):
+        with http_get(link, session, headers) as (status, response_headers, chunks):
+            if chunks is None and len(evictions) < 2:
+                evict(fp.name)
+            yield status, response_headers, chunks
+
+    monkeypatch.setattr(contextmanagers, "_http_get", revalidate_and_evict)
+    with contextmanagers.open_file(url, cache_dir=cache_dir.strpath) as fp:
+        assert fp.read() == b"contents"
+    assert http_server.statuses == [200, 200, 304, 200]
+    assert len(evictions) == 2
+
+
+@pytest.mark.parametrize("use_requests", [True, False])
+@pytest.mark.parametrize("accept_ranges", [True, False])
+def test_open_file_parallel(http_server, monkeypatch, use_requests, accept_ranges):
+    contents = os.urandom(10000)
+    http_server.root.join("large.whl").write_binary(contents)
+    http_server.accept_ranges = accept_ranges
+    http_server.truncate_ranges = 2
+    monkeypatch.setattr(contextmanagers, "_MIN_RANGE_SIZE", 1000)
+    if not use_requests:
+        monkeypatch.setitem(sys.modules, "requests", None)
+    url = "{}/large.whl".format(http_server.url)
+    with contextmanagers.open_file(url, parallel=4) as fp:
+        assert fp.read() == contents
+    if accept_ranges:
+        assert isinstance(fp, io.BufferedReader)
+        assert not os.path.exists(fp.name)
+        assert http_server.statuses.count(206) == 6
+    else:
+        assert 206 not in http_server.statuses
+
+
+@pytest.mark.parametrize("use_requests", [True, False])
+def test_open_file_parallel_without_head(http_server, monkeypatch, use_requests):
+    contents = os.urandom(10000)
+    http_server.root.join("signed.whl").write_binary(contents)
+    http_server.accept_ranges = True
+    http_server.reject_head = True
+    monkeypatch.setattr(contextmanagers, "_MIN_RANGE_SIZE", 1000)
+    if not use_requests:
+        monkeypatch.setitem(sys.modules, "requests", None)
+    url = "{}/signed.whl".format(http_server.url)
+    with contextmanagers.open_file(url, parallel=4) as fp:
+        assert fp.read() == contents
+    assert 403 not in http_server.statuses
+    assert http_server.statuses.count(206) == 5
+
+
+@pytest.mark.parametrize("use_requests", [True, False])
+def test_open_file_parallel_into_cache_dir(
+    http_server, tmpdir_factory, monkeypatch, use_requests
+):
+    cache_dir = tmpdir_factory.mktemp("cache")
+    contents = os.urandom(10000)
+    http_server.root.join("large.whl").write_binary(contents)
+    http_server.accept_ranges = True
+    monkeypatch.setattr(contextmanagers, "_MIN_RANGE_SIZE", 1000)
+    if not use_requests:
+        monkeypatch.setitem(sys.modules, "requests", None)
+    url = "{}/large.whl".format(http_server.url)
+    for _ in range(2):
+        with contextmanagers.open_file(
+            url, cache_dir=cache_dir.strpath, parallel=4
+        ) as fp:
+            assert fp.read() == contents
+    assert http_server.statuses == [206] * 5 + [304]
+    cached = cache_dir.join("content").visit(fil=lambda p: p.isfile())
+    assert [p.read_binary() for p in cached] == [contents]
+    assert cache_dir.join("tmp").listdir() == []
+
+
+def test_open_file_parallel_rejects_misplaced_ranges(http_server, monkeypatch):
+    contents = os.urandom(10000)
+    http_server.root.join("large.whl").write_binary(contents)
+    http_server.accept_ranges = True
+    http_server.misplace_ranges = True
+    monkeypatch.setattr(contextmanagers, "_MIN_RANGE_SIZE", 1000)
+    url = "{}/large.whl".format(http_server.url)
+    with contextmanagers.open_file(url, parallel=4) as fp:
+        assert fp.read() == contents
+    assert http_server.statuses[-1] == 200
+
+
+def test_open_file_parallel_copies_session(http_server, monkeypatch):
+    requests = pytest.importorskip("requests")
+    contents = os.urandom(10000)
+    http_server.root.join("large.whl").write_binary(contents)
+    http_server.accept_ranges = True
+    monkeypatch.setattr(contextmanagers, "_MIN_RANGE_SIZE", 1000)
+    used = []
+    http_get = contextmanagers._http_get
+
+    def record_http_get(link, session, headers):
+        used.append((session, session.headers.get("X-Token")))
+        return http_get(link, session, headers)
+
+    monkeypatch.setattr(contextmanagers, "_http_get", record_http_get)
+    session = requests.Session()
+    session.headers["X-Token"] = "secret"
+    url = "{}/large.whl".format(http_server.url)
+    with contextmanagers.open_file(url, session=session, parallel=4) as fp:
+        assert fp.read() == contents
+    assert len(used) == 4
+    assert len({id(worker_session) for worker_session, _ in used}) == 4
+    assert all(worker_session is not session for worker_session, _ in used)
+    assert all(token == "secret" for _, token in used)
+    assert all(
+        worker_session.adapters["http://"] is session.adapters["http://"]
+        for worker_session, _ in used
+    )
+
+
+def test_open_file_hashes(tmpdir, http_server):
+    contents = b"some package contents\n" * 1000
+    sha256 = hashlib.sha256(contents).hexdigest()
+    local_file = tmpdir.join("package.whl")
+    local_file.write_binary(contents)
+    with contextmanagers.open_file(local_file.strpath, hashes=["sha256", "md5"]) as fp:
+        copied = io.BytesIO()
+        shutil.copyfileobj(fp, copied)
+    assert copied.getvalue() == contents
+    assert fp.hexdigests() == {
+        "sha256": sha256,
+        "md5": hashlib.md5(contents).hexdigest(),
+    }
+    url = "{}/package.whl".format(http_server.url)
+    with contextmanagers.open_file(url, hashes={"sha256": [sha256, "0" * 64]}) as fp:
+        assert fp.readline() == b"some package contents\n"
+    assert fp.hexdigests()["sha256"] == sha256
+    with pytest.raises(ValueError, match="sha256 hash mismatch"):
+        with contextmanagers.open_file(url, hashes={"sha256": "0" * 64}) as fp:
+            fp.read()
+
+
+def test_open_file_mmap(tmpdir, http_server, tmpdir_factory):
+    local_file = tmpdir.join("package.whl")
+    local_file.write_binary(b"PK\x03\x04 wheel contents")
+    with contextmanagers.open_file(local_file.strpath, mmap=True) as mapped:
+        assert mapped[:4] == b"PK\x03\x04"
+        assert bytes(memoryview(mapped)[-8:]) == b"contents"
+        with pytest.raises(TypeError):
+            mapped[0] = 0
+    assert mapped.closed
+    empty_file = tmpdir.join("empty.txt")
+    empty_file.write_binary(b"")
+    with contextmanagers.open_file(empty_file.strpath, mmap=True) as mapped:
+        assert mapped == b""
+    url = "{}/package.whl".format(http_server.url)
+    with pytest.raises(ValueError):
+        with contextmanagers.open_file(url, mmap=True):
+            pass
+    cache_dir = tmpdir_factory.mktemp("cache").strpath
+    with contextmanagers.open_file(url, mmap=True, cache_dir=cache_dir) as mapped:
+        assert mapped[:] == local_file.read_binary()
+    with pytest.raises(ValueError):
+        with contextmanagers.open_file(local_file.strpath, mmap=True, hashes=["sha256"]):
+            pass
@@ -1,10 +1,16 @@
 # -*- coding=utf-8 -*-
 
+import array
+import asyncio
 import io
 import itertools
 import locale
+import mmap
 import os
+import signal
+import subprocess
 import sys
+import time
 
 import pytest
 from hypothesis import assume, given, strategies as st
@@ -66,6 +72,28 @@ def test_get_stream_results():
     )
 
 
+def test_stream_wrapper_decodes_split_chunks(monkeypatch):
+    class MockCmd(object):
+        def __init__(self, stdout):
+            self.stdout = stdout
+            self.stderr = None
+
+        def poll(self):
+            return 0
+
+        def wait(self, timeout=None):
+            return 0
+
+    raw = "caf\u00e9 \u0141\r\nsecond line\rlast".encode("utf-8")
+    stdout = io.TextIOWrapper(io.BytesIO(raw), encoding="utf-8")
+    # Force multi-byte characters and newlines to be split across reads
+    monkeypatch.setattr(vistir.misc.SubprocessStreamWrapper, "read_size", 1)
+    instance = vistir.misc.attach_stream_reader(
+        MockCmd(stdout), False, 50, spinner=None, stdout_allowed=False
+    )
+    assert instance.text_stdout_lines == ["caf\u00e9 \u0141", "second line", "last"]
+
+
 def test_run():
     out, err = vistir.misc.run(
         [r"{}".format(sys.executable), "-c", "print('hello')"], nospin=True
@@ -139,6 +167,275 @@ def test_nonblocking_run():
     assert "PYTHONDONTWRITEBYTECODE" in out, out
 
 
+@pytest.mark.flaky(reruns=5)
+def test_nonblocking_run_reads_both_streams():
+    script = "import sys; print('out'); sys.stderr.write('err\\n'); print('more out')"
+    c = vistir.misc.run(
+        [sys.executable, "-c", script],
+        block=False,
+        return_object=True,
+        combine_stderr=False,
+        nospin=True,
+    )
+    assert c.returncode == 0
+    assert c.text_stdout_lines == ["out", "more out"]
+    assert c.text_stderr_lines == ["err"]
+    assert not c.running
+
+
+def test_run_stream():
+    script = "import sys\nfor i in range(5000):\n    print(i)\nsys.stderr.write('bad\\n')"
+    lines = vistir.misc.run([sys.executable, "-c", script], stream=True, nospin=True)
+    results = list(lines)
+    assert [line for name, line in results if name == "stdout"] == [
+        str(i) for i in range(5000)
+    ]
+    assert ("stderr", "bad") in results
+
+
+def test_run_stream_return_object_keeps_tail():
+    script = "import sys\nfor i in range(100):\n    print(i)\nsys.exit(3)"
+    c = vistir.misc.run(
+        [sys.executable, "-c", script],
+        stream=True,
+        return_object=True,
+        tail_lines=3,
+        nospin=True,
+    )
+    assert sum(1 for _ in c) == 100
+    assert c.returncode == 3
+    assert list(c.tail) == [("stdout", "97"), ("stdout", "98"), ("stdout", "99")]
+
+
+def test_run_stream_terminates_when_closed():
+    script = "import time\nwhile True:\n    print('spam', flush=True)\n    time.sleep(0.01)"
+    c = vistir.misc.run(
+        [sys.executable, "-c", script], stream=True, return_object=True, nospin=True
+    )
+    lines = iter(c)
+    assert next(lines) == ("stdout", "spam")
+    lines.close()
+    assert c.returncode is not None
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Process groups are POSIX only")
+def test_run_stream_close_stops_background_processes():
+    script = "sleep 30 & while true; do echo spam; sleep 0.01; done"
+    c = vistir.misc.run(
+        ["sh", "-c", script], stream=True, return_object=True, nospin=True
+    )
+    lines = iter(c)
+    assert next(lines) == ("stdout", "spam")
+    start = time.monotonic()
+    lines.close()
+    assert time.monotonic() - start < 5
+    assert c.returncode is not None
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Process groups are POSIX only")
+def test_run_stream_close_abandons_escaped_processes(monkeypatch):
+    # The grandchild leaves the process group but keeps the pipe open
+    script = (
+        "import subprocess, sys, time\n"
+        "sleeper = subprocess.Popen(\n"
+        "    [sys.executable, '-c', 'import time; time.sleep(30)'],\n"
+        "    start_new_session=True,\n"
+        ")\n"
+        "print(sleeper.pid, flush=True)\n"
+        "while True:\n"
+        "    print('spam', flush=True)\n"
+        "    time.sleep(0.01)\n"
+    )
+    monkeypatch.setattr(vistir.misc.SubprocessStreamWrapper, "close_timeout", 0.5)
+    c = vistir.misc.run(
+        [sys.executable, "-c", script], stream=True, return_object=True, nospin=True
+    )
+    lines = iter(c)
+    sleeper_pid = int(next(lines)[1])
+    try:
+        assert next(lines) == ("stdout", "spam")
+        start = time.monotonic()
+        lines.close()
+        assert time.monotonic() - start < 5
+        assert c.returncode is not None
+    finally:
+        os.kill(sleeper_pid, signal.SIGKILL)
+
+
+def test_run_spill_to_disk():
+    script = "import sys\nfor i in range(1000):\n    print(i)\nsys.stderr.write('oops\\n')"
+    c = vistir.misc.run(
+        [sys.executable, "-c", script],
+        return_object=True,
+        tail_lines=2,
+        spill_to_disk=True,
+        nospin=True,
+    )
+    assert c.returncode == 0
+    assert c.out == "998\n999"
+    assert list(c.text_stdout_lines) == ["998", "999"]
+    assert c.err == "oops"
+    assert c.stdout_file.read().splitlines() == [str(i) for i in range(1000)]
+    assert c.stderr_file.read() == "oops\n"
+
+
+@pytest.mark.parametrize(
+    "capture", [{"tail_lines": 5}, {"tail_chars": 20}, {"spill_to_disk": True}]
+)
+def test_run_bounded_capture_consumes_output_while_running(monkeypatch, capture):
+    # With only a few lines allowed in the queue the child can only finish if
+    # its output is consumed while it is still running
+    monkeypatch.setattr(vistir.misc.SubprocessStreamWrapper, "max_queued_lines", 10)
+    monkeypatch.setattr(vistir.misc.SubprocessStreamWrapper, "spill_tail_lines", 5)
+    script = "for i in range(50000):\n    print('x' * 50, i)"
+    c = vistir.misc.run(
+        [sys.executable, "-c", script],
+        return_object=True,
+        nospin=True,
+        timeout=60,
+        **capture
+    )
+    assert c.returncode == 0
+    assert c._lines.maxsize == 10
+    assert len(c.text_stdout_lines) <= 5
+    assert c.out.splitlines()[-1] == "{} 49999".format("x" * 50)
+
+
+def test_tail_buffer_limits_size():
+    buffer = vistir.misc._TailBuffer(maxsize=10)
+    for line in ["aaaa", "bbbb", "cccc", "dd"]:
+        buffer.append(line)
+    assert list(buffer) == ["bbbb", "cccc", "dd"]
+    buffer.append("a very long line")
+    assert list(buffer) == ["a very long line"]
+
+
+@pytest.mark.parametrize("block", [True, False])
+def test_run_timeout(block):
+    script = "import time; print('started', flush=True); time.sleep(30)"
+    start = time.time()
+    with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+        vistir.misc.run(
+            [sys.executable, "-c", script], block=block, timeout=1, nospin=True
+        )
+    assert time.time() - start < 20
+    assert exc_info.value.output == "started"
+
+
+def _is_running(pid):
+    try:
+        with open("/proc/{}/stat".format(pid)) as fh:
+            state = fh.read().rpartition(")")[-1].split()[0]
+    except FileNotFoundError:
+        return False
+    return state != "Z"
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Inspects /proc")
+def test_run_timeout_kills_process_group():
+    script = (
+        "import signal, subprocess, sys, time\n"
+        "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+        "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+        "print(child.pid, flush=True)\n"
+        "time.sleep(30)"
+    )
+    start = time.time()
+    with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+        vistir.misc.run(
+            [sys.executable, "-c", script], timeout=1, kill_after=1, nospin=True
+        )
+    assert time.time() - start < 20
+    child_pid = int(exc_info.value.output)
+    time.sleep(0.5)
+    assert not _is_running(child_pid)
+
+
+def test_run_stream_timeout():
+    script = "import time; print('started', flush=True); time.sleep(30)"
+    lines = vistir.misc.run(
+        [sys.executable, "-c", script], stream=True, timeout=1, nospin=True
+    )
+    assert next(lines) == ("stdout", "started")
+    with pytest.raises(subprocess.TimeoutExpired):
+        next(lines)
+
+
+def test_run_async():
+    out, err = asyncio.run(
+        vistir.misc.run_async([sys.executable, "-c", "print('hello')"])
+    )
+    assert out == "hello"
+    c = asyncio.run(
+        vistir.misc.run_async(
+            [sys.executable, "-c", "import ajwfoiejaoiwj"], return_object=True
+        )
+    )
+    assert c.returncode != 0
+    assert c.out == ""
+    assert any(
+        error_text in c.err for error_text in ["ImportError", "ModuleNotFoundError"]
+    ), c.err
+
+
+def test_run_async_shell_builtin():
+    c = asyncio.run(vistir.misc.run_async("exit 3", return_object=True))
+    assert c.returncode == 3
+
+
+def test_run_async_timeout():
+    script = "import sys, time; print('started'); sys.stdout.flush(); time.sleep(30)"
+    with pytest.raises(subprocess.TimeoutExpired) as exc_info:
+        asyncio.run(vistir.misc.run_async([sys.executable, "-c", script], timeout=1))
+    assert exc_info.value.output == "started"
+
+
+def test_run_many():
+    commands = [
+        [sys.executable, "-c", "print({})".format(i)] for i in range(6)
+    ]
+    results = list(vistir.misc.run_many(commands, max_workers=2))
+    assert len(results) == 6
+    assert sorted(c.out for _, c in results) == [str(i) for i in range(6)]
+    for cmd, c in results:
+        assert c.returncode == 0
+        assert cmd[-1] == "print({})".format(c.out)
+
+
+def test_run_many_restores_event_loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        results = list(vistir.misc.run_many([[sys.executable, "-c", "print('ok')"]]))
+        assert [c.out for _, c in results] == ["ok"]
+        assert asyncio.get_event_loop() is loop
+        assert not loop.is_closed()
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_run_many_cancel_on_failure():
+    slow = [sys.executable, "-c", "import time; time.sleep(30)"]
+    failing = [sys.executable, "-c", "import sys; sys.exit(2)"]
+    start = time.time()
+    results = list(
+        vistir.misc.run_many([slow, failing, slow], max_workers=3, cancel_on_failure=True)
+    )
+    assert time.time() - start < 20
+    assert [(cmd, c.returncode) for cmd, c in results] == [(failing, 2)]
+
+
+def test_run_many_timeout():
+    slow = [sys.executable, "-c", "import time; time.sleep(30)"]
+    fast = [sys.executable, "-c", "print('done')"]
+    results = dict(
+        (cmd[-1], c) for cmd, c in vistir.misc.run_many([slow, fast], timeout=2)
+    )
+    assert results[fast[-1]].out == "done"
+    assert results[slow[-1]].returncode != 0
+
+
 def test_load_path():
     loaded_path = vistir.misc.load_path(sys.executable)
     assert any(sys.exec_prefix in loaded_sys_path for loaded_sys_path in loaded_path)
@@ -153,6 +450,59 @@ def test_partialclass():
 DIVIDE_ITERABLE = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
 
 
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("UTF8", "utf-8"),
+        ("utf_8", "utf-8"),
+        ("ASCII", "ascii"),
+        ("latin-1", "iso8859-1"),
+        ("not-a-real-codec", "not-a-real-codec"),
+    ],
+)
+def test_get_canonical_encoding_name(name, expected):
+    assert vistir.misc.get_canonical_encoding_name(name) == expected
+
+
+def test_to_bytes_and_to_text_roundtrip():
+    assert vistir.misc.to_bytes(b"caf\xc3\xa9", encoding="latin-1") == b"caf\xe9"
+    assert vistir.misc.to_text(b"caf\xe9", encoding="latin-1") == "caf\u00e9"
+    assert vistir.misc.to_text(vistir.misc.to_bytes("\udcff")) == "\udcff"
+
+
+def test_buffer_protocol_conversions(tmpdir):
+    data = "caf\u00e9".encode("utf-8")
+    assert vistir.misc.to_bytes(bytearray(data)) == data
+    assert vistir.misc.to_text(bytearray(data)) == "caf\u00e9"
+    assert vistir.misc.to_text(memoryview(data)) == "caf\u00e9"
+    assert vistir.misc.to_text(array.array("B", data)) == "caf\u00e9"
+    assert vistir.misc.to_bytes(memoryview(data), encoding="latin-1") == b"caf\xe9"
+    ints = array.array("i", [1, 2])
+    assert vistir.misc.to_bytes(ints) == ints.tobytes()
+    source = bytearray(data)
+    view = vistir.misc.to_bytes(source, copy=False)
+    assert isinstance(view, memoryview)
+    source[0:1] = b"C"
+    assert view.tobytes() == b"Caf\xc3\xa9"
+    view.release()
+    target = tmpdir.join("mapped.txt")
+    target.write_binary(data)
+    with open(target.strpath, "rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            assert vistir.misc.to_text(mapped) == "caf\u00e9"
+
+
+def test_batch_conversions():
+    values = ["caf\u00e9", b"caf\xc3\xa9", bytearray(b"abc"), 12, "\udcff"]
+    assert vistir.misc.to_text_many(values) == [vistir.misc.to_text(v) for v in values]
+    assert vistir.misc.to_bytes_many(values) == [vistir.misc.to_bytes(v) for v in values]
+    latin = ["caf\u00e9", b"caf\xc3\xa9"]
+    assert vistir.misc.to_bytes_many(latin, encoding="latin-1") == [b"caf\xe9"] * 2
+    assert vistir.misc.to_text_many(iter([b"caf\xe9"]), encoding="latin-1") == [
+        "caf\u00e9"
+    ]
+
+
 def test_stream_wrapper(capsys):
     new_stream = vistir.misc.get_text_stream("stdout")
     sys.stdout = new_stream
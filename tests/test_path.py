@@ -2,6 +2,8 @@ import io
 import os
 import shutil
 import stat
+import time
+import warnings
 
 import pytest
 from hypothesis import HealthCheck, assume, example, given, settings
@@ -35,6 +37,8 @@ def test_abspathu(tmpdir):
         ("~/some/path/child", "~/some/path", True),
         ("~/some", "~/some/path", False),
         ("~/some/path/child", "~", True),
+        ("~/some/pathname", "~/some/path", False),
+        ("~/some/path", "~/some/path", True),
     ],
 )
 def test_is_in_path(path, root, result):
@@ -90,6 +94,61 @@ def test_rmtree(tmpdir):
     assert not new_dir.exists()
 
 
+def test_rmtree_parallel(tmpdir):
+    new_dir = tmpdir.join("test_dir").mkdir()
+    for i in range(5):
+        sub_dir = new_dir.join("sub_{}".format(i)).mkdir()
+        sub_dir.join("nested").mkdir().join("leaf.txt").write("leaf")
+        for j in range(20):
+            sub_dir.join("file_{}.txt".format(j)).write("text")
+    outside = tmpdir.join("outside").mkdir()
+    outside.join("keep.txt").write("keep")
+    os.symlink(outside.strpath, new_dir.join("link").strpath)
+    readonly = new_dir.join("sub_0", "nested", "leaf.txt")
+    os.chmod(readonly.strpath, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    vistir.path.rmtree(new_dir.strpath, workers=4)
+    assert not new_dir.exists()
+    assert outside.join("keep.txt").exists()
+    vistir.path.rmtree(new_dir.strpath, workers=4)
+
+
+def test_rmtree_async(tmpdir):
+    new_dir = tmpdir.join("test_dir").mkdir()
+    new_dir.join("sub").mkdir().join("file.txt").write("text")
+    trash = vistir.path.rmtree_async(new_dir.strpath)
+    assert not new_dir.exists()
+    assert os.path.dirname(trash) == tmpdir.strpath
+    assert vistir.path.wait_for_pending_deletions(timeout=10)
+    assert not os.path.exists(trash)
+    assert tmpdir.listdir() == []
+    assert vistir.path.rmtree_async(new_dir.strpath) is None
+    other_dir = tmpdir.join("other_dir").mkdir()
+    vistir.path.rmtree(other_dir.strpath, deferred=True)
+    assert not other_dir.exists()
+    assert vistir.path.wait_for_pending_deletions(timeout=10)
+    assert tmpdir.listdir() == []
+
+
+def test_set_write_bit(tmpdir):
+    new_dir = tmpdir.join("test_dir").mkdir()
+    locked_dir = new_dir.join("locked").mkdir()
+    locked_file = locked_dir.join("file.txt")
+    locked_file.write("text")
+    outside = tmpdir.join("outside.txt")
+    outside.write("text")
+    os.symlink(outside.strpath, new_dir.join("link").strpath)
+    os.chmod(outside.strpath, stat.S_IRUSR)
+    os.chmod(locked_file.strpath, stat.S_IRUSR)
+    os.chmod(locked_dir.strpath, stat.S_IRUSR | stat.S_IXUSR)
+    vistir.path.set_write_bit(new_dir.strpath)
+    full_access = stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO
+    assert get_mode(locked_dir.strpath) & full_access == full_access
+    assert get_mode(locked_file.strpath) & full_access == full_access
+    assert get_mode(outside.strpath) & full_access == stat.S_IRUSR
+    os.chmod(outside.strpath, WRITEABLE)
+    vistir.path.set_write_bit(tmpdir.join("missing").strpath)
+
+
 def test_is_readonly_path(tmpdir):
     new_dir = tmpdir.join("some_dir").mkdir()
     new_file = new_dir.join("some_file.txt")
@@ -121,6 +180,26 @@ def test_is_valid_url(url):
     assert vistir.path.is_valid_url(unparsed_url)
 
 
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("https://pypi.org/simple", ("https", False, True)),
+        ("FILE:///tmp/some/file.txt", ("file", True, False)),
+        ("file://server/share/file.txt", ("file", True, True)),
+        ("file:relative/path", ("file", True, False)),
+        ("  git+https://github.com/sarugaku/vistir.git", ("git+https", False, True)),
+        ("ht\ttp://example.com", ("http", False, True)),
+        ("http://[::1", ("http", False, False)),
+        ("/home/user/code", ("", False, False)),
+        ("C:\\Users\\user", ("c", False, False)),
+        (b"https://pypi.org", ("https", False, True)),
+        ("", ("", False, False)),
+    ],
+)
+def test_classify_url(url, expected):
+    assert tuple(vistir.path.classify_url(url)) == expected
+
+
 def test_none_as_valid_url_returns_none():
     assert vistir.path.is_valid_url(None) is None
 
@@ -160,6 +239,23 @@ def test_path_to_url(filepath):
         assert not file_url
 
 
+def test_paths_to_urls_roundtrip(tmpdir):
+    paths = [
+        tmpdir.join("plain.txt").strpath,
+        tmpdir.join("with space", "a%20b.txt").strpath,
+        tmpdir.join("caf\u00e9.txt").strpath,
+    ]
+    urls = vistir.path.paths_to_urls(paths + [""])
+    assert urls == [vistir.path.path_to_url(path) for path in paths] + [""]
+    assert vistir.path.urls_to_paths(urls[:-1]) == paths
+    assert [vistir.path.url_to_path(url) for url in urls[:-1]] == paths
+    with vistir.contextmanagers.cd(tmpdir.strpath):
+        assert vistir.path.paths_to_urls(["plain.txt"]) == urls[:1]
+        assert vistir.path.path_to_url("plain.txt") == urls[0]
+    with pytest.raises(ValueError):
+        vistir.path.urls_to_paths(["https://example.com/file.txt"])
+
+
 @given(fspaths())
 @settings(suppress_health_check=(HealthCheck.filter_too_much,))
 def test_normalize_drive(filepath):
@@ -210,6 +306,128 @@ def test_walk_up(tmpdir):
         assert results == expected[i]
 
 
+def test_find_upwards(tmpdir):
+    project = tmpdir.join("project").mkdir()
+    project.join("pyproject.toml").write("")
+    nested = project.join("src", "package").ensure(dir=True)
+    nested.join("setup.py").write("")
+    pyproject = os.path.realpath(project.join("pyproject.toml").strpath)
+    assert vistir.path.find_upwards("pyproject.toml", nested.strpath) == pyproject
+    assert vistir.path.find_upwards(
+        ["Pipfile", "pyproject.toml"], nested.strpath
+    ) == pyproject
+    assert vistir.path.find_upwards(
+        ("setup.py", "pyproject.toml"), nested.strpath
+    ) == os.path.realpath(nested.join("setup.py").strpath)
+    assert vistir.path.find_upwards("vistir-missing-marker", nested.strpath) is None
+    with vistir.contextmanagers.cd(nested.strpath):
+        assert vistir.path.find_upwards("pyproject.toml") == pyproject
+
+
+def test_locate_upwards(tmpdir):
+    project = tmpdir.join("project").mkdir()
+    project.join("Pipfile").write("")
+    first = project.join("src", "first").ensure(dir=True)
+    second = project.join("src", "second").ensure(dir=True)
+    an_hour_ago = time.time() - 3600
+    for directory in (project, project.join("src"), first, second):
+        os.utime(directory.strpath, (an_hour_ago, an_hour_ago))
+    vistir.path.locate_upwards.cache_clear()
+    pipfile = os.path.realpath(project.join("Pipfile").strpath)
+    markers = ["pyproject.toml", "Pipfile"]
+    assert vistir.path.locate_upwards(markers, first.strpath) == pipfile
+    assert vistir.path.locate_upwards(markers, second.strpath) == pipfile
+    second.join("pyproject.toml").write("")
+    assert vistir.path.locate_upwards(markers, second.strpath) == os.path.realpath(
+        second.join("pyproject.toml").strpath
+    )
+    assert vistir.path.locate_upwards(markers, first.strpath) == pipfile
+    assert vistir.path.locate_upwards("vistir-missing-marker", first.strpath) is None
+
+
+def test_wait_for_files(tmpdir, monkeypatch):
+    new_dir = tmpdir.join("test_dir").mkdir()
+    new_dir.join("sub").mkdir().join("locked.txt").write("text")
+    new_dir.join("other.txt").write("text")
+    real_unlink = os.unlink
+    attempts = []
+
+    def flaky_unlink(path, *args, **kwargs):
+        if path.endswith("locked.txt") and len(attempts) < 3:
+            attempts.append(path)
+            raise PermissionError(13, "Permission denied", path)
+        return real_unlink(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "unlink", flaky_unlink)
+    assert vistir.path._wait_for_files(new_dir.strpath) is None
+    assert len(attempts) == 3
+    assert not new_dir.exists()
+
+    stuck = tmpdir.join("stuck.txt")
+    stuck.write("text")
+    def locked_unlink(path, *args, **kwargs):
+        raise PermissionError(13, "Permission denied", path)
+
+    monkeypatch.setattr(os, "unlink", locked_unlink)
+    start = time.monotonic()
+    assert vistir.path._wait_for_files(stuck.strpath, timeout=0.1) == [stuck.strpath]
+    assert time.monotonic() - start < 1
+
+
+@pytest.mark.parametrize("workers", [None, 4])
+def test_rmtree_non_writable_directory(tmpdir, monkeypatch, workers):
+    new_dir = tmpdir.join("test_dir").mkdir()
+    locked_dir = new_dir.join("locked").mkdir()
+    for i in range(7):
+        locked_dir.join("file_{}.txt".format(i)).write("text")
+    os.chmod(locked_dir.strpath, stat.S_IRUSR | stat.S_IXUSR)
+    real_unlink = os.unlink
+
+    def posix_unlink(path, *, dir_fd=None):
+        # Apply the parent directory check even when the tests run as root
+        if dir_fd is not None:
+            parent_stat = os.fstat(dir_fd)
+        else:
+            parent_stat = os.stat(os.path.dirname(path))
+        if not parent_stat.st_mode & stat.S_IWUSR:
+            raise PermissionError(13, "Permission denied", path)
+        return real_unlink(path, dir_fd=dir_fd)
+
+    monkeypatch.setattr(os, "unlink", posix_unlink)
+    start = time.monotonic()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        vistir.path.rmtree(new_dir.strpath, workers=workers)
+    assert time.monotonic() - start < 0.5
+    assert not new_dir.exists()
+
+
+@pytest.mark.parametrize("workers", [None, 4])
+def test_rmtree_retries_locked_files_together(tmpdir, monkeypatch, workers):
+    new_dir = tmpdir.join("test_dir").mkdir()
+    for name in ("one", "two"):
+        sub_dir = new_dir.join(name).mkdir()
+        for i in range(4):
+            sub_dir.join("locked_{}.txt".format(i)).write("text")
+        sub_dir.join("other.txt").write("text")
+    real_unlink = os.unlink
+
+    def locked_unlink(path, *args, **kwargs):
+        if os.path.basename(path).startswith("locked_"):
+            raise PermissionError(13, "Permission denied", path)
+        return real_unlink(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "unlink", locked_unlink)
+    start = time.monotonic()
+    with pytest.warns(ResourceWarning) as record:
+        vistir.path.rmtree(new_dir.strpath, workers=workers)
+    assert time.monotonic() - start < 3
+    assert len(record) == 1
+    assert sorted(p.basename for p in new_dir.visit()) == sorted(
+        ["one", "two"] + ["locked_{}.txt".format(i) for i in range(4)] * 2
+    )
+
+
 def test_handle_remove_readonly(tmpdir):
     test_file = tmpdir.join("test_file.txt")
     test_file.write_text(u"a bunch of text", encoding="utf-8")
@@ -222,3 +440,43 @@ def test_handle_remove_readonly(tmpdir):
         (fake_oserror.__class__, fake_oserror, "Fake traceback"),
     )
     assert not os.path.exists(test_file.strpath)
+
+
+def test_path_normalizer(tmpdir, monkeypatch):
+    normalizer = vistir.path.PathNormalizer(maxsize=2)
+    monkeypatch.setenv("VISTIR_TEST_ROOT", tmpdir.strpath)
+    expected = vistir.path.normalize_path(tmpdir.join("child").strpath)
+    assert normalizer("${VISTIR_TEST_ROOT}/child") == expected
+    monkeypatch.setenv("VISTIR_TEST_ROOT", tmpdir.join("other").strpath)
+    assert normalizer("${VISTIR_TEST_ROOT}/child") == vistir.path.normalize_path(
+        tmpdir.join("other", "child").strpath
+    )
+    with vistir.contextmanagers.cd(tmpdir.strpath):
+        assert normalizer("relative") == vistir.path.normalize_path("relative")
+    assert len(normalizer) == 2
+    normalizer.invalidate("relative")
+    assert len(normalizer) == 1
+    normalizer.invalidate()
+    assert len(normalizer) == 0
+
+
+def test_parent_path(tmpdir):
+    root = vistir.path.ParentPath(tmpdir.strpath, vistir.path.PathNormalizer())
+    assert tmpdir.join("some", "file.py").strpath in root
+    assert not root.contains(os.path.dirname(tmpdir.strpath))
+
+
+def test_path_index(tmpdir):
+    site_packages = tmpdir.join("lib", "site-packages").strpath
+    index = vistir.path.PathIndex([tmpdir.join("lib").strpath, site_packages])
+    index.add(site_packages + os.sep)
+    assert len(index) == 2
+    module = tmpdir.join("lib", "site-packages", "six.py").strpath
+    assert index.find(module) == site_packages
+    assert index.find_all(module) == [tmpdir.join("lib").strpath, site_packages]
+    assert index.find(tmpdir.join("lib", "site-packages-extra").strpath) == (
+        tmpdir.join("lib").strpath
+    )
+    assert tmpdir.join("libs", "six.py").strpath not in index
+    assert index.find(os.sep) is None
+    assert vistir.path.PathIndex([os.sep]).find(module) == os.sep